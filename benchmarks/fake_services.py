@@ -0,0 +1,208 @@
+"""Local stand-ins for the chat completions, DALL-E, image download and Wikipedia endpoints."""
+import io
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.config import CONFIG
+
+@dataclass
+class FaultProfile:
+    """Latency and failure injection for one fake endpoint."""
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: float = 0.1
+    content_policy_rate: float = 0.0
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing pooled keep-alive connections is expected, not an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def _placeholder_png(size: int) -> bytes:
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (size, size), color=(90, 110, 140)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def fake_storyboard(prompt: str) -> dict:
+    """Build a valid storyboard for the scene count requested in a generation prompt."""
+    match = re.search(r"- (\d+) scenes with", prompt)
+    num_scenes = int(match.group(1)) if match else 3
+    return {
+        "title": "Benchmark Storyboard",
+        "scenes": [{
+            "scene_number": i + 1,
+            "description": f"Benchmark scene {i + 1} with a wide establishing shot and soft light.",
+            "dialogue": {"narrator": f"Line {i + 1}."},
+            "mood": random.choice(CONFIG["moods"])
+        } for i in range(num_scenes)]
+    }
+
+class FakeServices:
+    """Threaded HTTP server that serves every fake endpoint on one local port."""
+
+    def __init__(self, llm: FaultProfile = None, images: FaultProfile = None, downloads: FaultProfile = None,
+                 wikipedia: FaultProfile = None, image_size: int = 256):
+        self.profiles = {
+            "llm": llm or FaultProfile(),
+            "images": images or FaultProfile(),
+            "downloads": downloads or FaultProfile(),
+            "wikipedia": wikipedia or FaultProfile()
+        }
+        self.image_bytes = _placeholder_png(image_size)
+        self.requests = Counter()
+        self.injected = Counter()
+        self._lock = threading.Lock()
+        self.server = _QuietServer(("127.0.0.1", 0), self._handler_class())
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, counter: Counter, key: str):
+        with self._lock:
+            counter[key] += 1
+
+    def _handler_class(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: dict = None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, status: int, payload: dict, headers: dict = None):
+                self._send(status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+            def _inject_fault(self, route: str) -> bool:
+                """Apply latency and maybe answer with a 429/500; returns True if a fault was sent."""
+                profile = services.profiles[route]
+                profile.delay()
+                roll = random.random()
+                if roll < profile.throttle_rate:
+                    services._count(services.injected, f"{route}:429")
+                    self._send_json(429, {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                                    headers={"Retry-After": str(profile.retry_after)})
+                    return True
+                if roll < profile.throttle_rate + profile.error_rate:
+                    services._count(services.injected, f"{route}:500")
+                    self._send_json(500, {"error": {"code": "InternalServerError", "message": "Injected failure"}})
+                    return True
+                return False
+
+            def _read_json(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                body = self._read_json()
+                if path.endswith("/chat/completions"):
+                    services._count(services.requests, "llm")
+                    if not self._inject_fault("llm"):
+                        self._chat_completion(body)
+                elif path.endswith("/images/generations"):
+                    services._count(services.requests, "images")
+                    if not self._inject_fault("images"):
+                        self._image_generation()
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path.startswith("/images/"):
+                    services._count(services.requests, "downloads")
+                    if not self._inject_fault("downloads"):
+                        self._send(200, services.image_bytes, "image/png")
+                elif path.startswith("/wiki/"):
+                    services._count(services.requests, "wikipedia")
+                    if not self._inject_fault("wikipedia"):
+                        genre = path.rsplit("/", 1)[-1].replace("_film", "")
+                        paragraphs = "".join(f"<p>{genre} films paragraph {i}. " + "Context " * 40 + "</p>" for i in range(5))
+                        html = f"<html><body><div id=\"mw-content-text\">{paragraphs}</div></body></html>"
+                        self._send(200, html.encode("utf-8"), "text/html; charset=utf-8")
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+            def _chat_completion(self, body: dict):
+                prompt = body["messages"][-1]["content"]
+                content = json.dumps(fake_storyboard(prompt))
+                completion_id = uuid.uuid4().hex
+                usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                         "total_tokens": (len(prompt) + len(content)) // 4}
+                if not body.get("stream"):
+                    self._send_json(200, {
+                        "id": completion_id, "object": "chat.completion", "created": int(time.time()),
+                        "model": body.get("model", "fake"), "usage": usage,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}]
+                    })
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                pieces = [content[i:i + 24] for i in range(0, len(content), 24)]
+                for i, piece in enumerate(pieces):
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": body.get("model", "fake"),
+                        "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece},
+                                     "finish_reason": "stop" if i == len(pieces) - 1 else None}]
+                    }
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                self._write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, text: str):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _image_generation(self):
+                if random.random() < services.profiles["images"].content_policy_rate:
+                    services._count(services.injected, "images:content_policy_violation")
+                    self._send_json(400, {"error": {
+                        "code": "content_policy_violation",
+                        "message": "Your request was rejected as a result of our safety system."
+                    }})
+                    return
+                self._send_json(200, {
+                    "created": int(time.time()),
+                    "data": [{"url": f"{services.base_url}/images/{uuid.uuid4().hex}.png",
+                              "revised_prompt": None}]
+                })
+
+        return Handler
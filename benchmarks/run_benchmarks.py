@@ -0,0 +1,218 @@
+"""End-to-end benchmarks for StoryboardAgent against local fake services.
+
+Usage:
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json   # flag regressions vs. a previous run
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List
+import numpy as np
+from src.config import CONFIG
+from src.sharded_kb import ShardedKnowledgeBase
+from src.utils import init_knowledge_base
+from .fake_services import FakeServices, FaultProfile
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STYLES = ["Cinematic", "Documentary", "Anime", "Noir", "Experimental"]
+
+class HashingEncoder:
+    """Deterministic stand-in for SentenceTransformer.encode, so benchmarks need no model download."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            return self._vector(sentences)
+        return np.stack([self._vector(text) for text in sentences])
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def measure(fn: Callable[[int], None], iterations: int, concurrency: int = 1) -> Dict:
+    """Run fn(i) iterations times and summarize throughput and latency percentiles."""
+    def timed(i: int) -> float:
+        start = time.perf_counter()
+        fn(i)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(timed, range(iterations))))
+    wall = time.perf_counter() - start
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "throughput_per_s": iterations / wall,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "mean_ms": float(latencies.mean() * 1000),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def build_synthetic_kb(knowledge_base_path: str, size: int, encoder: HashingEncoder) -> ShardedKnowledgeBase:
+    """Write a shared knowledge base of `size` synthetic plots in bulk, spread over genres and styles."""
+    kb = init_knowledge_base(knowledge_base_path)
+    rng = np.random.default_rng(size)
+    genres = ["heist", "space", "love", "mystery", "family"]
+    kb.append_many([({
+        "plot": f"Synthetic {genres[i % len(genres)]} plot {i}",
+        "storyboard": {"title": f"Synthetic {i}", "scenes": []},
+        "timestamp": str(datetime.now()),
+        "visual_style": STYLES[(i // len(genres)) % len(STYLES)]
+    }, rng.standard_normal(encoder.dim)) for i in range(size)])
+    return kb
+
+def configure(work_dir: str, services: FakeServices):
+    """Point every cache, output path and endpoint at the temporary work dir and fake services."""
+    CONFIG.update({
+        "output_dir": os.path.join(work_dir, "outputs"),
+        "result_cache_dir": os.path.join(work_dir, "cache", "results"),
+        "context_cache_path": os.path.join(work_dir, "cache", "genre_context.json"),
+        "wikipedia_base_url": f"{services.base_url}/wiki",
+        "semantic_reuse": False,
+        "backoff_base": 0.05,
+        "backoff_max": 1.0
+    })
+    os.environ["DALLE_MODEL_ENDPOINT"] = services.base_url
+    os.environ["DALLE_MODEL_API_KEY"] = "benchmark"
+
+def make_agent(knowledge_base_path: str, encoder, services: FakeServices):
+    from src.agent import StoryboardAgent
+    agent = StoryboardAgent(endpoint=services.base_url, api_key="benchmark", model_name="fake-llm",
+                            knowledge_base_path=knowledge_base_path)
+    if encoder is not None:
+        agent.embedding_model = encoder
+    return agent
+
+def run(args) -> Dict:
+    encoder = None if args.real_model else HashingEncoder()
+    services = FakeServices(
+        llm=FaultProfile(args.llm_latency, args.llm_latency / 4, args.error_rate, args.throttle_rate),
+        images=FaultProfile(args.image_latency, args.image_latency / 4, args.error_rate, args.throttle_rate,
+                            content_policy_rate=args.content_policy_rate),
+        downloads=FaultProfile(args.download_latency, args.download_latency / 4, args.error_rate),
+        wikipedia=FaultProfile(args.download_latency)
+    )
+    results = {}
+    with services, tempfile.TemporaryDirectory() as work_dir:
+        configure(work_dir, services)
+        CONFIG.update(cpu_pool=args.cpu_pool, cpu_workers=args.cpu_workers)
+        agent = make_agent(os.path.join(work_dir, "generate", "knowledge_base.json"), encoder, services)
+        for num_scenes in args.scenes:
+            def generate(i, num_scenes=num_scenes):
+                output_dir = os.path.join(CONFIG["output_dir"], f"generate_{num_scenes}_{i}")
+                agent.generate_storyboard(f"Benchmark plot {num_scenes}-{i}", num_scenes, STYLES[i % len(STYLES)],
+                                          output_dir=output_dir, bypass_cache=True)
+            results[f"generate_storyboard[scenes={num_scenes}]"] = measure(generate, args.iterations, args.concurrency)
+            print(f"  generate_storyboard scenes={num_scenes} done")
+
+        for kb_size in args.kb_sizes:
+            kb_path = os.path.join(work_dir, f"kb_{kb_size}", "knowledge_base.json")
+            build_synthetic_kb(kb_path, kb_size, encoder or HashingEncoder())
+            start = time.perf_counter()
+            kb_agent = make_agent(kb_path, encoder, services)
+            kb_agent.knowledge_base.refresh()
+            load_seconds = time.perf_counter() - start
+            retrieve = measure(lambda i: kb_agent.retrieve_similar_plots(f"Query plot {i}"), args.queries)
+            retrieve["index_load_ms"] = load_seconds * 1000
+            results[f"retrieve_similar_plots[kb={kb_size}]"] = retrieve
+            results[f"update_knowledge_base[kb={kb_size}]"] = measure(
+                lambda i: kb_agent._update_knowledge_base(f"New plot {i}", {"title": "t", "scenes": []}, "Noir"),
+                args.queries)
+            print(f"  knowledge base size={kb_size} done")
+    return {
+        "timestamp": str(datetime.now()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "arguments": vars(args),
+        "service_requests": dict(services.requests),
+        "injected_faults": dict(services.injected),
+        "results": results
+    }
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Return a line per metric that regressed by more than `tolerance` versus the baseline."""
+    regressions = []
+    for name, result in current["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        for metric, higher_is_worse in (("p50_ms", True), ("p99_ms", True), ("throughput_per_s", False)):
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append(f"{name} {metric}: {old:.2f} -> {new:.2f} ({change:+.1%})")
+    return regressions
+
+def print_report(report: Dict):
+    print(f"{'benchmark':<42}{'ops/s':>10}{'p50 ms':>11}{'p99 ms':>11}{'peak RSS MB':>13}")
+    for name, result in report["results"].items():
+        rss = result["peak_rss_mb"]
+        print(f"{name:<42}{result['throughput_per_s']:>10.2f}{result['p50_ms']:>11.2f}{result['p99_ms']:>11.2f}"
+              f"{(f'{rss:.0f}' if rss is not None else 'n/a'):>13}")
+    print(f"service requests: {report['service_requests']}  injected faults: {report['injected_faults']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the storyboard pipeline against local fake services.")
+    parser.add_argument("--scenes", type=int, nargs="+", default=[1, 3, 5], help="Scene counts to generate")
+    parser.add_argument("--kb-sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Knowledge base sizes")
+    parser.add_argument("--iterations", type=int, default=5, help="Storyboards per scene count")
+    parser.add_argument("--queries", type=int, default=200, help="Retrievals and updates per knowledge base size")
+    parser.add_argument("--concurrency", type=int, default=1, help="Storyboards generated at once")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mean fake LLM latency in seconds")
+    parser.add_argument("--image-latency", type=float, default=0.5, help="Mean fake DALL-E latency in seconds")
+    parser.add_argument("--download-latency", type=float, default=0.05, help="Mean fake download latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--content-policy-rate", type=float, default=0.0, help="Fraction of image prompts rejected")
+    parser.add_argument("--real-model", action="store_true", help="Use the configured SentenceTransformer")
+    parser.add_argument("--cpu-pool", action="store_true", help="Run CPU-bound stages in the process pool")
+    parser.add_argument("--cpu-workers", type=int, help="CPU pool processes (default: one per core)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown before flagging")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"⚠️ Regression: {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Micro-benchmark of the image prompt sanitizer over a large synthetic prompt corpus.
+
+Compares the precompiled single-pass PromptSanitizer against the previous implementation
+(lowercase the prompt, then one re.sub per term) and checks they rewrite the same terms.
+
+Usage:
+    python -m benchmarks.sanitizer_benchmark --prompts 100000
+"""
+import argparse
+import json
+import random
+import re
+import time
+from typing import Callable, Dict, List
+from src.config import CONFIG
+from src.sanitizer import PromptSanitizer
+
+FILLER = ("the rain falls over a quiet street while neon signs flicker and a lone figure waits by the door "
+          "as the camera slowly pushes in through the fog toward the window of an old apartment").split()
+
+def legacy_sanitize(prompt: str) -> str:
+    """The sanitizer this benchmark replaces, kept verbatim as the baseline."""
+    replacements = {
+        r'\bmurder\b': 'mysterious event',
+        r'\bkill\b': 'confront',
+        r'\bknife\b': 'object',
+        r'\bblood\b': 'shadow',
+        r'\bviolent\b': 'tense',
+        r'\bdeath\b': 'disappearance',
+        r'\bwet dress\b': 'rain-soaked clothing',
+        r'\bdress adhering to her form\b': 'clothing damp from rain'
+    }
+    sanitized = prompt.lower()
+    for pattern, replacement in replacements.items():
+        sanitized = re.sub(pattern, replacement, sanitized, flags=re.IGNORECASE)
+    return sanitized
+
+def build_corpus(size: int, words: int, term_rate: float, seed: int = 0) -> List[str]:
+    """Scene prompts of roughly `words` words where about term_rate of the words are sensitive terms."""
+    rng = random.Random(seed)
+    terms = [term for tier in CONFIG["sanitizer_terms"] for term in tier]
+    corpus = []
+    for _ in range(size):
+        tokens = [rng.choice(terms) if rng.random() < term_rate else rng.choice(FILLER) for _ in range(words)]
+        tokens[0] = tokens[0].capitalize()
+        corpus.append(f'A cinematic style scene from a film about "{" ".join(tokens[:6])}". {" ".join(tokens[6:])}.')
+    return corpus
+
+def time_corpus(fn: Callable[[str], str], corpus: List[str]) -> Dict:
+    start = time.perf_counter()
+    for prompt in corpus:
+        fn(prompt)
+    elapsed = time.perf_counter() - start
+    megabytes = sum(len(prompt) for prompt in corpus) / 1e6
+    return {"seconds": round(elapsed, 4), "prompts_per_s": round(len(corpus) / elapsed, 1),
+            "mb_per_s": round(megabytes / elapsed, 2)}
+
+def run(args) -> Dict:
+    corpus = build_corpus(args.prompts, args.words, args.term_rate)
+    start = time.perf_counter()
+    sanitizer = PromptSanitizer(CONFIG["sanitizer_terms"])
+    results = {"compile_ms": round((time.perf_counter() - start) * 1000, 3),
+               "legacy": time_corpus(legacy_sanitize, corpus)}
+    for level in range(1, sanitizer.levels + 1):
+        results[f"level_{level}"] = time_corpus(lambda prompt: sanitizer.sanitize(prompt, level), corpus)
+    # Level 1 holds the legacy terms, so on lowercased input both must agree
+    mismatches = sum(sanitizer.sanitize(prompt.lower(), 1) != legacy_sanitize(prompt) for prompt in corpus[:1000])
+    return {"prompts": args.prompts, "words": args.words, "term_rate": args.term_rate,
+            "level_1_mismatches": mismatches, "results": results}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the prompt sanitizer on a synthetic corpus.")
+    parser.add_argument("--prompts", type=int, default=100000, help="Prompts in the corpus")
+    parser.add_argument("--words", type=int, default=60, help="Words per prompt")
+    parser.add_argument("--term-rate", type=float, default=0.05, help="Fraction of words that are sensitive terms")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(f"{'sanitizer':<12}{'seconds':>10}{'prompts/s':>14}{'MB/s':>9}")
+    for name, result in report["results"].items():
+        if isinstance(result, dict):
+            print(f"{name:<12}{result['seconds']:>10.3f}{result['prompts_per_s']:>14.0f}{result['mb_per_s']:>9.2f}")
+    print(f"compile: {report['results']['compile_ms']:.2f} ms  level 1 mismatches vs legacy: {report['level_1_mismatches']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,50 @@
+import copy
+import difflib
 import json
 import re
-import requests
 import os
-from typing import Dict, List
-from bs4 import BeautifulSoup
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
-from datetime import datetime
-from azure.ai.inference import ChatCompletionsClient
-from azure.ai.inference.models import SystemMessage, UserMessage
-from azure.core.credentials import AzureKeyCredential
-from openai import AzureOpenAI
-from PIL import Image, ImageDraw, ImageFont
-from IPython.display import display, Markdown
+import threading
+import asyncio
+from collections import OrderedDict, deque
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from .config import CONFIG
-from .utils import init_knowledge_base
+from . import tracing
+from .models import get_embedding_model, encode_texts
+from .utils import init_knowledge_base, display_markdown, detect_genre, wikipedia_intro
+from . import cpu_pool
+from .context_cache import get_context_cache
+from .json_stream import SceneStreamParser, loads_repaired
+from .result_cache import ResultCache, get_result_cache
+from .sanitizer import get_sanitizer
+from .transport import get_session, call_with_retries, acall_with_retries, download_file, adownload_file
+from .image_pipeline import render_placeholder, submit_contact_sheet, submit_variants
+from .vector_index import load_record
 
 class StoryboardAgent:
-    """Main agent class for storyboard generation with DeepSeek API, RAG, and DALL-E 3 images."""
+    """Main agent class for storyboard generation with DeepSeek API, RAG, and DALL-E 3 images.
 
-    def __init__(self, endpoint: str, api_key: str, model_name: str, knowledge_base_path: str = None):
-        try:
-            self.embedding_model = SentenceTransformer(CONFIG["embedding_model"])
-        except Exception as e:
-            print(f"⚠️ Could not load embedding model: {e}")
-            self.embedding_model = None
-        
-        # Initialize DeepSeek client
-        self.client = ChatCompletionsClient(
-            endpoint=endpoint,
-            credential=AzureKeyCredential(api_key)
-        )
+    The embedding model and API clients are created on first use, so constructing an
+    agent is cheap.
+    """
+
+    def __init__(self, endpoint: str, api_key: str, model_name: str, knowledge_base_path: str = None,
+                 llm_concurrency: int = None, image_concurrency: int = None):
+        self._embedding_model = None
+        self.endpoint = endpoint
+        self.api_key = api_key
         self.model_name = model_name
-        
-        # Initialize Azure OpenAI client for DALL-E 3
-        self.image_client = AzureOpenAI(
-            api_version="2024-02-01",
-            azure_endpoint=os.environ["DALLE_MODEL_ENDPOINT"],
-            api_key=os.environ["DALLE_MODEL_API_KEY"]
-        )
+        self._client = None
+        self._image_client = None
+        self._client_lock = threading.Lock()
+        self._async_state = None
+        self.result_cache = get_result_cache()
+        self._reuse_lock = threading.Lock()
+        # Running totals, plus a bounded window of recent best similarities, so long-lived servers do not grow
+        self.reuse_stats = {"lookups": 0, "hits": 0, "hit_similarity_sum": 0.0,
+                            "best_similarities": deque(maxlen=CONFIG["reuse_stats_window"])}
+        self._embedding_memo = OrderedDict()
+        self._embedding_memo_lock = threading.Lock()
         
         self.knowledge_base_path = knowledge_base_path or CONFIG["knowledge_base"]
         self.available_functions = {
@@ -47,35 +52,323 @@ class StoryboardAgent:
             "analyze_mood": self.analyze_mood,
             "save_storyboard": self.save_storyboard
         }
-        init_knowledge_base(self.knowledge_base_path)
+        self.knowledge_base = init_knowledge_base(self.knowledge_base_path)
+        # Caps on in-flight API calls shared by every storyboard this agent generates
+        self.llm_concurrency = llm_concurrency or CONFIG["llm_concurrency"]
+        self.image_concurrency = image_concurrency or CONFIG["image_concurrency"]
+        self.llm_slots = threading.BoundedSemaphore(self.llm_concurrency)
+        self.image_slots = threading.BoundedSemaphore(self.image_concurrency)
+
+    @property
+    def embedding_model(self):
+        """Process-wide SentenceTransformer, loaded on first use; None if unavailable."""
+        if self._embedding_model is None:
+            return get_embedding_model(CONFIG["embedding_model"])
+        return self._embedding_model
+
+    @embedding_model.setter
+    def embedding_model(self, model):
+        self._embedding_model = model
+
+    def _embed(self, text: str):
+        """Encode text, memoized so a generation call encodes its plot once for reuse, RAG and the KB update."""
+        model = self.embedding_model
+        if model is None:
+            return None
+        key = (id(model), text)
+        with self._embedding_memo_lock:
+            if key in self._embedding_memo:
+                self._embedding_memo.move_to_end(key)
+                tracing.inc("embedding_memo_requests_total", result="hit")
+                return self._embedding_memo[key]
+        tracing.inc("embedding_memo_requests_total", result="miss")
+        with tracing.span("embed"):
+            if self._embedding_model is None and cpu_pool.enabled():
+                # Encode in a CPU worker, off the GIL of the generation threads
+                embeddings = cpu_pool.run(encode_texts, CONFIG["embedding_model"], [text])
+                if embeddings is None:
+                    return None
+                embedding = embeddings[0]
+            else:
+                embedding = model.encode(text)
+        with self._embedding_memo_lock:
+            self._embedding_memo[key] = embedding
+            while len(self._embedding_memo) > CONFIG["embedding_memo_size"]:
+                self._embedding_memo.popitem(last=False)
+        return embedding
+
+    @property
+    def client(self):
+        """DeepSeek client, created on first use; retries are handled by transport.call_with_retries."""
+        with self._client_lock:
+            if self._client is None:
+                from azure.ai.inference import ChatCompletionsClient
+                from azure.core.credentials import AzureKeyCredential
+                self._client = ChatCompletionsClient(
+                    endpoint=self.endpoint,
+                    credential=AzureKeyCredential(self.api_key),
+                    retry_total=0
+                )
+            return self._client
+
+    @property
+    def image_client(self):
+        """Azure OpenAI client for DALL-E 3, created on first use."""
+        with self._client_lock:
+            if self._image_client is None:
+                from openai import AzureOpenAI
+                self._image_client = AzureOpenAI(
+                    api_version="2024-02-01",
+                    azure_endpoint=os.environ["DALLE_MODEL_ENDPOINT"],
+                    api_key=os.environ["DALLE_MODEL_API_KEY"],
+                    max_retries=0
+                )
+            return self._image_client
 
     def execute_function(self, function_name: str, **kwargs):
         """Execute a registered function with error handling."""
         if function_name not in self.available_functions:
             raise ValueError(f"Unknown function: {function_name}")
         try:
-            display(Markdown(f"🔧 Executing {function_name.replace('_', ' ')}..."))
-            return self.available_functions[function_name](**kwargs)
+            display_markdown(f"🔧 Executing {function_name.replace('_', ' ')}...")
+            with tracing.span(f"execute:{function_name}"):
+                return self.available_functions[function_name](**kwargs)
         except Exception as e:
-            display(Markdown(f"⚠️ **Error in {function_name}:** {str(e)}"))
+            display_markdown(f"⚠️ **Error in {function_name}:** {str(e)}")
             return None
 
-    def generate_storyboard(self, plot: str, num_scenes: int = 3, visual_style: str = "Cinematic") -> Dict:
-        """Generate a storyboard using DeepSeek API with RAG context and DALL-E 3 images."""
-        similar_plots = self.retrieve_similar_plots(plot)
+    def generate_storyboard(self, plot: str, num_scenes: int = 3, visual_style: str = "Cinematic", output_dir: str = None,
+                            bypass_cache: bool = False) -> Dict:
+        """Generate a storyboard using DeepSeek API with RAG context and DALL-E 3 images.
+
+        Scene images are written to output_dir, which defaults to the knowledge base folder.
+        Cached storyboards and images are reused unless bypass_cache is set.
+        When tracing is enabled, a per-stage trace is written to <output_dir>/trace.json.
+        """
+        output_dir = output_dir or os.path.dirname(self.knowledge_base_path)
+        with tracing.trace("generate_storyboard", output_dir, plot=plot, num_scenes=num_scenes, visual_style=visual_style):
+            return self._generate_storyboard(plot, num_scenes, visual_style, output_dir, bypass_cache)
+
+    def _generate_storyboard(self, plot: str, num_scenes: int, visual_style: str, output_dir: str, bypass_cache: bool) -> Dict:
+        storyboard = self._semantic_reuse(plot, num_scenes, visual_style, output_dir, bypass_cache)
+        if storyboard is not None:
+            self._update_knowledge_base(plot, storyboard, visual_style, output_dir)
+            return storyboard
+        cache_key = self._storyboard_cache_key(plot, num_scenes, visual_style)
+        storyboard = None if bypass_cache else self.result_cache.get_json(cache_key)
+        if storyboard is None:
+            prompt = self._prepare_prompt(plot, num_scenes, visual_style)
+            storyboard = self._call_generation_api(prompt, plot, num_scenes)
+            self._cache_storyboard(cache_key, storyboard)
+        if storyboard:
+            os.makedirs(output_dir or ".", exist_ok=True)
+            self._generate_scene_images(storyboard.get("scenes", []), plot, visual_style, output_dir, bypass_cache)
+            self._build_contact_sheet(storyboard, output_dir)
+            self._update_knowledge_base(plot, storyboard, visual_style, output_dir)
+        return storyboard
+
+    def _prepare_prompt(self, plot: str, num_scenes: int, visual_style: str) -> str:
+        """Retrieve similar plots and build the generation prompt."""
+        similar_plots = self.retrieve_similar_plots(plot, visual_style=visual_style)
         rag_context = "\nSimilar plots:\n" + "\n".join(
             [f"- {p['plot']}" for p in similar_plots[:2]]) if similar_plots else ""
-        prompt = self._build_prompt(plot, num_scenes, rag_context, visual_style)
-        storyboard = self._call_generation_api(prompt)
-        if storyboard:
-            # Generate images for each scene
-            for scene in storyboard.get("scenes", []):
-                image_filename = self._generate_scene_image(scene, plot, visual_style, os.path.dirname(self.knowledge_base_path))
-                if image_filename:
-                    scene["image_filename"] = image_filename
-            self._update_knowledge_base(plot, storyboard)
+        with tracing.span("prompt_build") as span:
+            prompt = self._build_prompt(plot, num_scenes, rag_context, visual_style)
+            span.set(similar_plots=len(similar_plots), prompt_chars=len(prompt))
+        return prompt
+
+    def _storyboard_cache_key(self, plot: str, num_scenes: int, visual_style: str) -> str:
+        """Cache key for an LLM storyboard; RAG context is left out so re-runs of a plot still hit."""
+        return ResultCache.key("storyboard", self.model_name, CONFIG["moods"], plot, num_scenes, visual_style)
+
+    def _cache_storyboard(self, cache_key: str, storyboard: Dict):
+        """Store a valid LLM storyboard, without per-run image filenames, in the result cache.
+
+        Storyboards with placeholder scenes are not cached, so the next run asks the LLM again.
+        """
+        if (storyboard and self.validate_storyboard(storyboard)
+                and not any(scene.get("placeholder") for scene in storyboard["scenes"])):
+            scenes = [{k: v for k, v in scene.items() if k not in ("image_filename", "image_variants")}
+                      for scene in storyboard["scenes"]]
+            self.result_cache.put_json(cache_key, {**storyboard, "scenes": scenes})
+
+    def stream_storyboard(self, plot: str, num_scenes: int = 3, visual_style: str = "Cinematic", output_dir: str = None,
+                          bypass_cache: bool = False) -> Iterator[Dict]:
+        """Generate a storyboard, yielding each scene (with its image) in order as soon as it is ready.
+
+        The LLM response is consumed as a token stream and each scene's image job starts as
+        soon as that scene's JSON object closes. The generator's return value is the
+        complete storyboard.
+        """
+        output_dir = output_dir or os.path.dirname(self.knowledge_base_path)
+        with tracing.trace("stream_storyboard", output_dir, plot=plot, num_scenes=num_scenes, visual_style=visual_style):
+            return (yield from self._stream_storyboard(plot, num_scenes, visual_style, output_dir, bypass_cache))
+
+    def _stream_storyboard(self, plot: str, num_scenes: int, visual_style: str, output_dir: str,
+                           bypass_cache: bool) -> Iterator[Dict]:
+        os.makedirs(output_dir or ".", exist_ok=True)
+        reused = self._semantic_reuse(plot, num_scenes, visual_style, output_dir, bypass_cache)
+        if reused is not None:
+            yield from reused["scenes"]
+            self._update_knowledge_base(plot, reused, visual_style, output_dir)
+            return reused
+        cache_key = self._storyboard_cache_key(plot, num_scenes, visual_style)
+        cached = None if bypass_cache else self.result_cache.get_json(cache_key)
+        parser = SceneStreamParser()
+        pending, scenes, submitted = [], [], set()
+        with ThreadPoolExecutor(max_workers=self.image_concurrency) as executor:
+            def submit(scene):
+                pending.append((scene, executor.submit(
+                    tracing.propagate(self._generate_scene_image), scene, plot, visual_style, output_dir, bypass_cache)))
+
+            def finished(wait: bool):
+                while pending and (wait or pending[0][1].done()):
+                    scene, future = pending.pop(0)
+                    if future.result():
+                        scene["image_filename"] = future.result()
+                    scenes.append(scene)
+                    yield scene
+
+            if cached is not None:
+                streamed = cached
+                for scene in cached["scenes"]:
+                    submit(scene)
+            else:
+                prompt = self._prepare_prompt(plot, num_scenes, visual_style)
+                try:
+                    with self.llm_slots, tracing.span("llm_stream") as span:
+                        response = call_with_retries(lambda: self.client.complete(
+                            messages=self._generation_messages(prompt),
+                            max_tokens=1024,
+                            model=self.model_name,
+                            stream=True
+                        ))
+                        for update in response:
+                            delta = update.choices[0].delta.content if update.choices else None
+                            for scene in parser.feed(delta or ""):
+                                scene = self._normalize_scene(scene, len(submitted) + 1)
+                                # Extra scenes beyond num_scenes are dropped, as on the blocking path
+                                if (scene is not None and 1 <= scene["scene_number"] <= num_scenes
+                                        and scene["scene_number"] not in submitted):
+                                    submitted.add(scene["scene_number"])
+                                    submit(scene)
+                            yield from finished(wait=False)
+                        span.set(output_chars=len(parser.text))
+                except Exception as e:
+                    print(f"Error streaming storyboard: {str(e)}")
+                # Regenerate only the scenes that did not stream intact (all of them if nothing did)
+                streamed = self._complete_storyboard(
+                    prompt, plot, num_scenes, self._parse_storyboard(parser.text) if parser.text else None,
+                    attempts=CONFIG["max_retries"] - 1)
+                for scene in streamed["scenes"]:
+                    if scene["scene_number"] not in submitted:
+                        submit(scene)
+                self._cache_storyboard(cache_key, streamed)
+            yield from finished(wait=True)
+        storyboard = dict(streamed or {"title": f"Untitled {plot}"})
+        storyboard["scenes"] = sorted(scenes, key=lambda scene: scene.get("scene_number", 0))
+        self._build_contact_sheet(storyboard, output_dir)
+        self._update_knowledge_base(plot, storyboard, visual_style, output_dir)
         return storyboard
 
+    def find_semantic_match(self, plot: str, num_scenes: int, visual_style: str) -> Optional[Tuple[Dict, float]]:
+        """Find a stored plot with the same style above the semantic reuse threshold.
+
+        Storyboards with placeholder scenes (from a failed generation) are never matched.
+        The best similarities of recent lookups are kept in reuse_stats for threshold tuning.
+        """
+        self.knowledge_base.refresh()
+        searched = self.knowledge_base.size(plot, visual_style, scope="shard")
+        if not searched or not self.embedding_model:
+            return None
+        query = self._embed(plot)
+        with tracing.span("vector_search", index_size=searched):
+            candidates = self.knowledge_base.search(query, top_k=10, plot=plot, visual_style=visual_style, scope="shard")
+        match = None
+        for candidate, similarity in candidates:
+            if similarity < CONFIG["semantic_reuse_threshold"]:
+                break
+            # The index only holds plot metadata; the storyboard is read for candidates above the threshold
+            record = load_record(candidate)
+            if record is None:
+                continue
+            stored_style = record.get("visual_style") or record["storyboard"].get("visual_style", "")
+            scenes = record["storyboard"].get("scenes", [])
+            if (stored_style.lower() == visual_style.lower() and len(scenes) >= num_scenes
+                    and not any(scene.get("placeholder") for scene in scenes)):
+                match = (record, similarity)
+                break
+        with self._reuse_lock:
+            self.reuse_stats["lookups"] += 1
+            self.reuse_stats["best_similarities"].append(candidates[0][1] if candidates else None)
+            if match:
+                self.reuse_stats["hits"] += 1
+                self.reuse_stats["hit_similarity_sum"] += match[1]
+        tracing.inc("semantic_reuse_lookups_total", result="hit" if match else "miss")
+        return match
+
+    def reuse_report(self) -> Dict:
+        """Summarize semantic reuse hit rate and similarities (best_similarities covers recent lookups only)."""
+        with self._reuse_lock:
+            stats = copy.deepcopy(self.reuse_stats)
+        best = [sim for sim in stats["best_similarities"] if sim is not None]
+        return {
+            "threshold": CONFIG["semantic_reuse_threshold"],
+            "lookups": stats["lookups"],
+            "hits": stats["hits"],
+            "hit_rate": stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0,
+            "mean_hit_similarity": stats["hit_similarity_sum"] / stats["hits"] if stats["hits"] else None,
+            "best_similarities": sorted(best, reverse=True)
+        }
+
+    def _semantic_reuse(self, plot: str, num_scenes: int, visual_style: str, output_dir: str, bypass_cache: bool) -> Optional[Dict]:
+        """Adapt a stored storyboard of a near-paraphrased plot instead of generating a new one.
+
+        Stored images are linked into output_dir; scenes whose image is missing or a placeholder are re-rendered.
+        Returns None when semantic reuse is disabled or there is no match.
+        """
+        if bypass_cache or not CONFIG["semantic_reuse"]:
+            return None
+        match = self.find_semantic_match(plot, num_scenes, visual_style)
+        if match is None:
+            return None
+        record, similarity = match
+        print(f"🔁 Reusing storyboard of a similar plot (similarity {similarity:.3f}): {record['plot'][:60]}")
+        storyboard = copy.deepcopy(record["storyboard"])
+        storyboard["scenes"] = storyboard["scenes"][:num_scenes]
+        storyboard["reused_from"] = {"plot": record["plot"], "similarity": round(similarity, 4)}
+        os.makedirs(output_dir or ".", exist_ok=True)
+        missing = []
+        for scene in storyboard["scenes"]:
+            image_filename = scene.get("image_filename")
+            source = os.path.join(record.get("output_dir") or "", image_filename or "")
+            if (not image_filename or image_filename.startswith("placeholder_") or not record.get("output_dir")
+                    or not os.path.isfile(source)):
+                missing.append(scene)
+            elif os.path.abspath(source) != os.path.abspath(os.path.join(output_dir, image_filename)):
+                self.result_cache.link_into(source, os.path.join(output_dir, image_filename))
+                variants = scene.pop("image_variants", {})
+                for kind, variant in variants.items():
+                    if os.path.isfile(os.path.join(record["output_dir"], variant)):
+                        self.result_cache.link_into(os.path.join(record["output_dir"], variant), os.path.join(output_dir, variant))
+                        scene.setdefault("image_variants", {})[kind] = variant
+        self._generate_scene_images(missing, plot, visual_style, output_dir)
+        self._build_contact_sheet(storyboard, output_dir)
+        return storyboard
+
+    def _generate_scene_images(self, scenes: List[Dict], plot: str, visual_style: str, output_dir: str, bypass_cache: bool = False):
+        """Generate images for all scenes concurrently, keeping results in scene order."""
+        if not scenes:
+            return
+        max_workers = max(1, min(self.image_concurrency, len(scenes)))
+        generate = tracing.propagate(self._generate_scene_image)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            image_filenames = list(executor.map(
+                lambda scene: generate(scene, plot, visual_style, output_dir, bypass_cache), scenes))
+        for scene, image_filename in zip(scenes, image_filenames):
+            if image_filename:
+                scene["image_filename"] = image_filename
+
     def _build_prompt(self, plot: str, num_scenes: int, rag_context: str = "", visual_style: str = "Cinematic") -> str:
         """Construct the generation prompt for DeepSeek API."""
         genre = self.detect_genre(plot)
@@ -98,125 +391,456 @@ Example Dialogue:
 {script_example}
 Output:"""
 
-    def _sanitize_prompt(self, prompt: str) -> str:
-        """Sanitize the prompt to avoid content policy violations."""
-        # Replace sensitive terms
-        replacements = {
-            r'\bmurder\b': 'mysterious event',
-            r'\bkill\b': 'confront',
-            r'\bknife\b': 'object',
-            r'\bblood\b': 'shadow',
-            r'\bviolent\b': 'tense',
-            r'\bdeath\b': 'disappearance',
-            r'\bwet dress\b': 'rain-soaked clothing',
-            r'\bdress adhering to her form\b': 'clothing damp from rain'
-        }
-        sanitized = prompt.lower()
-        for pattern, replacement in replacements.items():
-            sanitized = re.sub(pattern, replacement, sanitized, flags=re.IGNORECASE)
-        return sanitized
+    def _sanitize_prompt(self, prompt: str, level: int = 1) -> str:
+        """Sanitize the prompt to avoid content policy violations; higher levels rewrite more terms."""
+        return get_sanitizer().sanitize(prompt, level)
 
     def _create_placeholder_image(self, scene_number: int, output_dir: str) -> str:
         """Create a placeholder PNG for failed image generation."""
+        tracing.inc("placeholder_images_total")
         try:
-            image = Image.new('RGB', (1024, 1024), color='gray')
-            draw = ImageDraw.Draw(image)
-            try:
-                font = ImageFont.truetype("arial.ttf", 40)
-            except:
-                font = ImageFont.load_default()
-            text = f"Scene {scene_number}\nImage Not Generated"
-            draw.text((50, 450), text, fill='white', font=font)
             placeholder_filename = os.path.join(output_dir, f"placeholder_scene_{scene_number}.png")
-            image.save(placeholder_filename)
+            with tracing.span("placeholder_render", scene=scene_number):
+                self.result_cache.link_into(self._placeholder_asset(), placeholder_filename)
             print(f"Created placeholder image: {placeholder_filename}")
             return os.path.basename(placeholder_filename)
         except Exception as e:
             print(f"Error creating placeholder image for scene {scene_number}: {str(e)}")
             return None
 
-    def _generate_scene_image(self, scene: Dict, plot: str, visual_style: str, output_dir: str) -> str:
-        """Generate an image for a scene using DALL-E 3 and save it."""
-        scene_number = scene.get("scene_number", 1)
+    def _placeholder_asset(self) -> str:
+        """Path of the shared placeholder PNG in the result cache, rendering it on first use."""
+        key = ResultCache.key("placeholder", "1024x1024")
+        cached = self.result_cache.get_file(key, ".png")
+        if cached is None:
+            rendered = os.path.join(self.result_cache.root, f"placeholder.{threading.get_ident()}.png")
+            os.makedirs(self.result_cache.root, exist_ok=True)
+            render_placeholder(rendered)
+            cached = self.result_cache.put_file(key, ".png", rendered)
+            os.remove(rendered)
+        return cached
+
+    def _encode_variants(self, scene: Dict, image_filename: Optional[str], output_dir: str):
+        """Write the compressed and thumbnail variants of a scene image in the image pool."""
+        if not CONFIG["image_variants"] or not image_filename:
+            return
+        try:
+            with tracing.span("image_encode"):
+                scene["image_variants"] = submit_variants(os.path.join(output_dir, image_filename)).result()
+        except Exception as e:
+            print(f"Error encoding image variants for {image_filename}: {str(e)}")
+
+    async def _aencode_variants(self, scene: Dict, image_filename: Optional[str], output_dir: str):
+        """Async variant of _encode_variants."""
+        if not CONFIG["image_variants"] or not image_filename:
+            return
+        try:
+            with tracing.span("image_encode"):
+                future = submit_variants(os.path.join(output_dir, image_filename))
+                scene["image_variants"] = await asyncio.wrap_future(future)
+        except Exception as e:
+            print(f"Error encoding image variants for {image_filename}: {str(e)}")
+
+    def _build_contact_sheet(self, storyboard: Dict, output_dir: str):
+        """Tile the storyboard's scene images into contact_sheet.jpg in the image pool."""
+        if not CONFIG["image_variants"]:
+            return
+        try:
+            with tracing.span("contact_sheet"):
+                future = submit_contact_sheet(storyboard, output_dir)
+                if future is not None:
+                    storyboard["contact_sheet"] = os.path.basename(future.result())
+        except Exception as e:
+            print(f"Error building contact sheet: {str(e)}")
+
+    async def _abuild_contact_sheet(self, storyboard: Dict, output_dir: str):
+        """Async variant of _build_contact_sheet."""
+        if not CONFIG["image_variants"]:
+            return
+        try:
+            with tracing.span("contact_sheet"):
+                future = submit_contact_sheet(storyboard, output_dir)
+                if future is not None:
+                    storyboard["contact_sheet"] = os.path.basename(await asyncio.wrap_future(future))
+        except Exception as e:
+            print(f"Error building contact sheet: {str(e)}")
+
+    def _scene_image_prompts(self, scene: Dict, plot: str, visual_style: str) -> List[str]:
+        """Build the DALL-E 3 prompts for a scene: the full prompt at each rewrite level, then a generic one."""
         description = scene.get("description", "A generic scene")
         mood = scene.get("mood", "neutral")
-        max_retries = 2
-        
-        for attempt in range(max_retries):
-            try:
-                # Build and sanitize DALL-E 3 prompt
-                raw_prompt = f"""
+        raw_prompt = f"""
 A {visual_style.lower()} style scene from a film about "{plot}". {description}. 
 The mood is {mood}, reflected in lighting, colors, and atmosphere. 
 Maintain consistent {visual_style.lower()} art style, color palette, and visual tone across all scenes.
 Highly detailed, vivid, and cinematic composition.
 """
-                image_prompt = self._sanitize_prompt(raw_prompt)
-                print(f"Generating image for scene {scene_number} with prompt: {image_prompt[:100]}...")
-                
-                # Call DALL-E 3 API
-                result = self.image_client.images.generate(
-                    model="scene-maker",
-                    prompt=image_prompt,
-                    n=1,
-                    size="1024x1024"
-                )
-                
-                # Get image URL and download
-                image_url = json.loads(result.model_dump_json())['data'][0]['url']
+        safe_prompt = f"""
+A {visual_style.lower()} style scene depicting a {mood} moment in a film. 
+A generic setting with characters in appropriate attire, focusing on atmosphere and lighting. 
+Maintain consistent {visual_style.lower()} art style and color palette.
+Highly detailed and cinematic.
+"""
+        # One prompt per rewrite level, so retries keep the scene description, then the generic fallback;
+        # levels that leave the prompt unchanged are skipped since they would be rejected again
+        prompts = []
+        for level in range(1, get_sanitizer().levels + 1):
+            sanitized = self._sanitize_prompt(raw_prompt, level)
+            if sanitized not in prompts:
+                prompts.append(sanitized)
+        return prompts + [safe_prompt]
+
+    @staticmethod
+    def _image_cacheable(attempt: int, prompts: List[str]) -> bool:
+        """Whether an image for prompts[attempt] may be cached and reused across scenes.
+
+        The last prompt is the generic fallback, which depends only on style and mood, so
+        reusing its image would give unrelated scenes the identical picture.
+        """
+        return attempt < len(prompts) - 1
+
+    def _image_cache_key(self, image_prompt: str) -> str:
+        return ResultCache.key("image", "scene-maker", "1024x1024", image_prompt)
+
+    def _reuse_cached_image(self, image_prompt: str, image_filename: str, bypass_cache: bool) -> bool:
+        """Link a cached image for this prompt into place; returns True on a cache hit."""
+        cached = None if bypass_cache else self.result_cache.get_file(self._image_cache_key(image_prompt), ".png")
+        if cached is None:
+            return False
+        self.result_cache.link_into(cached, image_filename)
+        print(f"Reused cached image: {image_filename}")
+        return True
+
+    def _generate_scene_image(self, scene: Dict, plot: str, visual_style: str, output_dir: str, bypass_cache: bool = False) -> str:
+        """Generate an image for a scene using DALL-E 3 and save it."""
+        scene_number = scene.get("scene_number", 1)
+        with tracing.span("scene_image", scene=scene_number):
+            image_filename = self._render_scene_image(scene_number, scene, plot, visual_style, output_dir, bypass_cache)
+            self._encode_variants(scene, image_filename, output_dir)
+            return image_filename
+
+    def _render_scene_image(self, scene_number: int, scene: Dict, plot: str, visual_style: str, output_dir: str,
+                            bypass_cache: bool) -> str:
+        prompts = self._scene_image_prompts(scene, plot, visual_style)
+        
+        for attempt, image_prompt in enumerate(prompts):
+            try:
                 image_filename = os.path.join(output_dir, f"scene_{scene_number}.png")
-                
-                # Download and save image
-                response = requests.get(image_url)
-                response.raise_for_status()
-                with open(image_filename, 'wb') as f:
-                    f.write(response.content)
+                cacheable = self._image_cacheable(attempt, prompts)
+                if cacheable and self._reuse_cached_image(image_prompt, image_filename, bypass_cache):
+                    return os.path.basename(image_filename)
+                print(f"Generating image for scene {scene_number} with prompt: {image_prompt[:100]}...")
+                with self.image_slots:
+                    # Call DALL-E 3 API
+                    with tracing.span("image_generate", prompt_attempt=attempt):
+                        result = call_with_retries(lambda: self.image_client.images.generate(
+                            model="scene-maker",
+                            prompt=image_prompt,
+                            n=1,
+                            size="1024x1024"
+                        ))
+                    
+                    # Get image URL, then download and save image
+                    image_url = json.loads(result.model_dump_json())['data'][0]['url']
+                    with tracing.span("image_download"):
+                        call_with_retries(lambda: download_file(image_url, image_filename))
+                if cacheable:
+                    self.result_cache.put_file(self._image_cache_key(image_prompt), ".png", image_filename)
                 
                 print(f"Saved image to: {image_filename}")
                 return os.path.basename(image_filename)
             
             except Exception as e:
-                if 'content_policy_violation' in str(e) and attempt < max_retries - 1:
-                    # Retry with a safer fallback prompt
-                    print(f"Content policy violation for scene {scene_number}, retrying with safer prompt...")
-                    image_prompt = f"""
-A {visual_style.lower()} style scene depicting a {mood} moment in a film. 
-A generic setting with characters in appropriate attire, focusing on atmosphere and lighting. 
-Maintain consistent {visual_style.lower()} art style and color palette.
-Highly detailed and cinematic.
-"""
+                if self._handle_image_error(e, scene_number, attempt, len(prompts)):
                     continue
-                print(f"Error generating image for scene {scene_number}: {str(e)}")
-                display(Markdown(f"⚠️ **Error generating image for scene {scene_number}:** {str(e)}"))
-                # Use placeholder image on final failure
                 return self._create_placeholder_image(scene_number, output_dir)
         return self._create_placeholder_image(scene_number, output_dir)
 
-    def _call_generation_api(self, prompt: str) -> Dict:
-        """Call DeepSeek API to generate a storyboard."""
+    def _handle_image_error(self, error: Exception, scene_number: int, attempt: int, attempts: int) -> bool:
+        """Report an image generation error; returns True if the next (safer) prompt should be tried."""
+        tracing.inc("image_errors_total", kind="content_policy" if 'content_policy_violation' in str(error) else "other")
+        if 'content_policy_violation' in str(error) and attempt < attempts - 1:
+            print(f"Content policy violation for scene {scene_number}, retrying with safer prompt...")
+            return True
+        print(f"Error generating image for scene {scene_number}: {str(error)}")
+        display_markdown(f"⚠️ **Error generating image for scene {scene_number}:** {str(error)}")
+        return False
+
+    def _generation_messages(self, prompt: str) -> List:
+        from azure.ai.inference.models import SystemMessage, UserMessage
         system_prompt = "You are a precise and creative assistant that generates valid JSON output based on the provided instructions."
+        return [SystemMessage(content=system_prompt), UserMessage(content=prompt)]
+
+    def _parse_storyboard(self, raw_output: str) -> Optional[Dict]:
+        """Repair and parse the storyboard JSON from raw LLM output, keeping only valid, normalized scenes.
+
+        Returns None if no JSON object can be recovered; the result may be missing scenes.
+        """
+        with tracing.span("json_parse", output_chars=len(raw_output)) as span:
+            parsed = loads_repaired(raw_output)
+            if not isinstance(parsed, dict):
+                span.set(valid=False)
+                tracing.inc("llm_invalid_outputs_total")
+                return None
+            raw_scenes = parsed.get("scenes") if isinstance(parsed.get("scenes"), list) else []
+            scenes = [scene for scene in (self._normalize_scene(scene, i + 1) for i, scene in enumerate(raw_scenes))
+                      if scene is not None]
+            span.set(scenes=len(scenes), invalid_scenes=len(raw_scenes) - len(scenes))
+            if len(scenes) < len(raw_scenes):
+                tracing.inc("llm_invalid_scenes_total", len(raw_scenes) - len(scenes))
+            storyboard = {key: value for key, value in parsed.items() if key != "scenes"}
+            storyboard["scenes"] = scenes
+            return storyboard
+
+    def _nearest_mood(self, mood) -> Optional[str]:
+        """Map a free-form mood onto CONFIG["moods"]: exact, alias, contained word, then closest spelling."""
+        if not isinstance(mood, str):
+            return None
+        mood = mood.strip().lower()
+        moods = CONFIG["moods"]
+        if mood in moods:
+            return mood
+        if mood in CONFIG["mood_aliases"]:
+            return CONFIG["mood_aliases"][mood]
+        for word in re.findall(r"[a-z]+", mood):
+            if word in moods:
+                return word
+            if word in CONFIG["mood_aliases"]:
+                return CONFIG["mood_aliases"][word]
+        matches = difflib.get_close_matches(mood, moods, n=1, cutoff=0.6)
+        return matches[0] if matches else None
+
+    def _normalize_scene(self, scene, position: int) -> Optional[Dict]:
+        """Return a valid copy of scene with its mood snapped to an allowed value, or None if unusable."""
+        if not isinstance(scene, dict) or not scene.get("description"):
+            return None
+        mood = self._nearest_mood(scene.get("mood"))
+        if mood is None:
+            return None
+        if mood != scene.get("mood"):
+            tracing.inc("moods_normalized_total")
+        scene = dict(scene, mood=mood)
+        try:
+            scene["scene_number"] = int(scene.get("scene_number") or position)
+        except (TypeError, ValueError):
+            scene["scene_number"] = position
+        scene.setdefault("dialogue", "...")
+        return scene
+
+    def _missing_scenes(self, storyboard: Optional[Dict], num_scenes: int) -> List[int]:
+        """Scene numbers 1..num_scenes without a valid scene in storyboard."""
+        present = {scene["scene_number"] for scene in storyboard["scenes"]} if storyboard else set()
+        return [number for number in range(1, num_scenes + 1) if number not in present]
+
+    def _merge_scenes(self, storyboard: Optional[Dict], parsed: Optional[Dict], num_scenes: int) -> Optional[Dict]:
+        """Add the parsed scenes that storyboard is missing, keeping scenes 1..num_scenes in order."""
+        if storyboard is None and parsed is None:
+            return None
+        merged = dict(storyboard or parsed)
+        by_number = {}
+        # Both inputs are range-checked: a streamed storyboard may still hold scenes beyond num_scenes
+        for scene in (storyboard or {}).get("scenes", []) + (parsed or {}).get("scenes", []):
+            if 1 <= scene["scene_number"] <= num_scenes:
+                by_number.setdefault(scene["scene_number"], scene)
+        merged["scenes"] = [by_number[number] for number in sorted(by_number)]
+        return merged
+
+    def _regeneration_prompt(self, prompt: str, storyboard: Dict, missing: List[int]) -> str:
+        """Prompt asking for only the missing scenes, with the valid ones as context."""
+        written = "\n".join(f"- Scene {scene['scene_number']} ({scene['mood']}): {scene['description']}"
+                             for scene in storyboard["scenes"])
+        numbers = ", ".join(str(number) for number in missing)
+        return f"""{prompt}
+These scenes are already written:
+{written}
+Return strictly valid JSON containing ONLY scenes {numbers}:
+{{"scenes": [{{"scene_number": ..., "description": ..., "dialogue": ..., "mood": ...}}]}}
+Output:"""
+
+    def _next_request(self, prompt: str, storyboard: Optional[Dict], num_scenes: int) -> Optional[str]:
+        """The prompt for the next generation attempt, or None once every scene is valid."""
+        missing = self._missing_scenes(storyboard, num_scenes)
+        if storyboard is None or not storyboard["scenes"]:
+            return prompt
+        if not missing:
+            return None
+        tracing.inc("llm_scene_regenerations_total", len(missing))
+        return self._regeneration_prompt(prompt, storyboard, missing)
+
+    def _complete_storyboard(self, prompt: str, plot: str, num_scenes: int, storyboard: Optional[Dict] = None,
+                             attempts: int = None) -> Dict:
+        """Call the LLM until scenes 1..num_scenes are all valid, regenerating only missing or invalid scenes.
+
+        Scenes still missing after the attempts are filled from the fallback storyboard.
+        """
+        attempts = CONFIG["max_retries"] if attempts is None else attempts
+        storyboard = self._merge_scenes(None, storyboard, num_scenes)
+        for attempt in range(attempts):
+            request = self._next_request(prompt, storyboard, num_scenes)
+            if request is None:
+                break
+            try:
+                with self.llm_slots, tracing.span("llm_call", attempt=attempt):
+                    response = call_with_retries(lambda: self.client.complete(
+                        messages=self._generation_messages(request),
+                        max_tokens=1024,
+                        model=self.model_name
+                    ))
+            except Exception as e:
+                print(f"Error calling generation API: {str(e)}")
+                continue
+            storyboard = self._merge_scenes(
+                storyboard, self._parse_storyboard(response.choices[0].message.content), num_scenes)
+        return self._fill_missing_scenes(storyboard, plot, num_scenes)
+
+    def _fill_missing_scenes(self, storyboard: Optional[Dict], plot: str, num_scenes: int) -> Dict:
+        fallback = self._create_fallback_storyboard(plot, num_scenes)
+        if storyboard is None or not storyboard["scenes"]:
+            return fallback
+        storyboard = self._merge_scenes(storyboard, fallback, num_scenes)
+        storyboard.setdefault("title", fallback["title"])
+        return storyboard
+
+    def _call_generation_api(self, prompt: str, plot: str, num_scenes: int) -> Dict:
+        """Call DeepSeek API to generate a storyboard."""
+        return self._complete_storyboard(prompt, plot, num_scenes)
+
+    def _get_async_state(self) -> Dict:
+        """Lazily create the async clients and concurrency limits for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._async_state is None or self._async_state["loop"] is not loop:
+            import httpx
+            from azure.ai.inference.aio import ChatCompletionsClient as AsyncChatCompletionsClient
+            from azure.core.credentials import AzureKeyCredential
+            from openai import AsyncAzureOpenAI
+            self._async_state = {
+                "loop": loop,
+                "client": AsyncChatCompletionsClient(
+                    endpoint=self.endpoint,
+                    credential=AzureKeyCredential(self.api_key),
+                    retry_total=0
+                ),
+                "image_client": AsyncAzureOpenAI(
+                    api_version="2024-02-01",
+                    azure_endpoint=os.environ["DALLE_MODEL_ENDPOINT"],
+                    api_key=os.environ["DALLE_MODEL_API_KEY"],
+                    max_retries=0
+                ),
+                "http": httpx.AsyncClient(
+                    timeout=CONFIG["http_timeout"],
+                    limits=httpx.Limits(max_connections=CONFIG["http_pool_size"])
+                ),
+                "llm_slots": asyncio.Semaphore(self.llm_concurrency),
+                "image_slots": asyncio.Semaphore(self.image_concurrency)
+            }
+        return self._async_state
+
+    async def aclose(self):
+        """Close the pooled async clients."""
+        if self._async_state is not None:
+            state, self._async_state = self._async_state, None
+            await state["client"].close()
+            await state["image_client"].close()
+            await state["http"].aclose()
+
+    async def agenerate_storyboard(self, plot: str, num_scenes: int = 3, visual_style: str = "Cinematic", output_dir: str = None,
+                                   bypass_cache: bool = False) -> Dict:
+        """Async variant of generate_storyboard, so many storyboards can share one event loop."""
+        output_dir = output_dir or os.path.dirname(self.knowledge_base_path)
+        with tracing.trace("agenerate_storyboard", output_dir, plot=plot, num_scenes=num_scenes, visual_style=visual_style):
+            return await self._agenerate_storyboard(plot, num_scenes, visual_style, output_dir, bypass_cache)
+
+    async def _agenerate_storyboard(self, plot: str, num_scenes: int, visual_style: str, output_dir: str,
+                                    bypass_cache: bool) -> Dict:
+        reused = await asyncio.to_thread(self._semantic_reuse, plot, num_scenes, visual_style, output_dir, bypass_cache)
+        if reused is not None:
+            await asyncio.to_thread(self._update_knowledge_base, plot, reused, visual_style, output_dir)
+            return reused
+        cache_key = self._storyboard_cache_key(plot, num_scenes, visual_style)
+        # Cache reads and writes touch the disk (and may evict), so keep them off the event loop
+        storyboard = None if bypass_cache else await asyncio.to_thread(self.result_cache.get_json, cache_key)
+        if storyboard is None:
+            prompt = await asyncio.to_thread(self._prepare_prompt, plot, num_scenes, visual_style)
+            storyboard = await self._acall_generation_api(prompt, plot, num_scenes)
+            await asyncio.to_thread(self._cache_storyboard, cache_key, storyboard)
+        if storyboard:
+            os.makedirs(output_dir or ".", exist_ok=True)
+            scenes = storyboard.get("scenes", [])
+            image_filenames = await asyncio.gather(
+                *(self._agenerate_scene_image(scene, plot, visual_style, output_dir, bypass_cache) for scene in scenes))
+            for scene, image_filename in zip(scenes, image_filenames):
+                if image_filename:
+                    scene["image_filename"] = image_filename
+            await self._abuild_contact_sheet(storyboard, output_dir)
+            await asyncio.to_thread(self._update_knowledge_base, plot, storyboard, visual_style, output_dir)
+        return storyboard
+
+    async def _acall_generation_api(self, prompt: str, plot: str, num_scenes: int) -> Dict:
+        """Async variant of _call_generation_api."""
+        state = self._get_async_state()
+        storyboard = None
         for attempt in range(CONFIG["max_retries"]):
+            request = self._next_request(prompt, storyboard, num_scenes)
+            if request is None:
+                break
             try:
-                response = self.client.complete(
-                    messages=[
-                        SystemMessage(content=system_prompt),
-                        UserMessage(content=prompt)
-                    ],
-                    max_tokens=1024,
-                    model=self.model_name
-                )
-                raw_output = response.choices[0].message.content
-                json_match = re.search(r'\{.*\}', raw_output, re.DOTALL)
-                if json_match:
-                    storyboard = json.loads(json_match.group(0))
-                    if self.validate_storyboard(storyboard):
-                        return storyboard
+                async with state["llm_slots"]:
+                    with tracing.span("llm_call", attempt=attempt):
+                        response = await acall_with_retries(lambda: state["client"].complete(
+                            messages=self._generation_messages(request),
+                            max_tokens=1024,
+                            model=self.model_name
+                        ))
+            except Exception as e:
+                print(f"Error calling generation API: {str(e)}")
+                continue
+            storyboard = self._merge_scenes(
+                storyboard, self._parse_storyboard(response.choices[0].message.content), num_scenes)
+        return self._fill_missing_scenes(storyboard, plot, num_scenes)
+
+    async def _agenerate_scene_image(self, scene: Dict, plot: str, visual_style: str, output_dir: str, bypass_cache: bool = False) -> str:
+        """Async variant of _generate_scene_image."""
+        state = self._get_async_state()
+        scene_number = scene.get("scene_number", 1)
+        with tracing.span("scene_image", scene=scene_number):
+            image_filename = await self._arender_scene_image(state, scene_number, scene, plot, visual_style, output_dir,
+                                                             bypass_cache)
+            await self._aencode_variants(scene, image_filename, output_dir)
+            return image_filename
+
+    async def _arender_scene_image(self, state: Dict, scene_number: int, scene: Dict, plot: str, visual_style: str,
+                                   output_dir: str, bypass_cache: bool) -> str:
+        prompts = self._scene_image_prompts(scene, plot, visual_style)
+        for attempt, image_prompt in enumerate(prompts):
+            try:
+                image_filename = os.path.join(output_dir, f"scene_{scene_number}.png")
+                cacheable = self._image_cacheable(attempt, prompts)
+                if cacheable and await asyncio.to_thread(self._reuse_cached_image, image_prompt, image_filename,
+                                                         bypass_cache):
+                    return os.path.basename(image_filename)
+                async with state["image_slots"]:
+                    with tracing.span("image_generate", prompt_attempt=attempt):
+                        result = await acall_with_retries(lambda: state["image_client"].images.generate(
+                            model="scene-maker",
+                            prompt=image_prompt,
+                            n=1,
+                            size="1024x1024"
+                        ))
+                    image_url = result.data[0].url
+                    with tracing.span("image_download"):
+                        await acall_with_retries(lambda: adownload_file(state["http"], image_url, image_filename))
+                if cacheable:
+                    await asyncio.to_thread(self.result_cache.put_file, self._image_cache_key(image_prompt), ".png",
+                                            image_filename)
+                print(f"Saved image to: {image_filename}")
+                return os.path.basename(image_filename)
             except Exception as e:
-                if attempt == CONFIG["max_retries"] - 1:
-                    return self._create_fallback_storyboard(prompt.split('"')[1] if '"' in prompt else prompt)
-        return self._create_fallback_storyboard(prompt.split('"')[1] if '"' in prompt else prompt)
+                if self._handle_image_error(e, scene_number, attempt, len(prompts)):
+                    continue
+                break
+        return await asyncio.to_thread(self._create_placeholder_image, scene_number, output_dir)
 
-    def _create_fallback_storyboard(self, plot: str) -> Dict:
+    def _create_fallback_storyboard(self, plot: str, num_scenes: int = 3) -> Dict:
         """Create a fallback storyboard if API fails."""
         return {
             "title": f"Untitled {plot}",
@@ -224,37 +848,34 @@ Highly detailed and cinematic.
                 "scene_number": i+1,
                 "description": f"Scene {i+1} of {plot}",
                 "dialogue": "...",
-                "mood": "neutral"
-            } for i in range(3)]
+                "mood": "neutral",
+                "placeholder": True
+            } for i in range(num_scenes)]
         }
 
     def detect_genre(self, plot: str) -> str:
         """Detect film genre from plot keywords."""
-        plot_lower = plot.lower()
-        genre_map = [
-            (["heist", "robbery", "steal"], "heist"),
-            (["sci-fi", "futuristic", "space", "alien"], "sci-fi"),
-            (["romance", "love", "relationship"], "romance"),
-            (["thriller", "suspense", "mystery"], "thriller")
-        ]
-        for keywords, genre in genre_map:
-            if any(word in plot_lower for word in keywords):
-                return genre
-        return CONFIG["default_genre"]
+        return detect_genre(plot)
 
     def fetch_wikipedia_film_data(self, genre: str) -> str:
-        """Fetch film context from Wikipedia."""
-        url = f"https://en.wikipedia.org/wiki/{genre}_film"
+        """Fetch film context from Wikipedia, served from the context cache when possible."""
+        with tracing.span("genre_context", genre=genre):
+            context = get_context_cache().get(f"wikipedia:{genre}", lambda: self._fetch_wikipedia_page(genre))
+        return context if context is not None else f"Standard {genre} film context."
+
+    def _fetch_wikipedia_page(self, genre: str) -> Optional[str]:
+        """Download and parse the Wikipedia film page for a genre."""
+        url = f"{CONFIG['wikipedia_base_url']}/{genre}_film"
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            content = soup.find('div', {'id': 'mw-content-text'})
-            paragraphs = content.find_all('p')[:3] if content else []
-            return " ".join([p.get_text().strip() for p in paragraphs if p.get_text().strip()])[:CONFIG["context_length"]]
+            with tracing.span("wikipedia_fetch") as span:
+                response = get_session().get(url, timeout=10)
+                response.raise_for_status()
+                span.set(bytes=len(response.content))
+            with tracing.span("html_parse"):
+                return cpu_pool.run(wikipedia_intro, response.text, CONFIG["context_length"])
         except Exception as e:
-            display(Markdown(f"⚠️ **Wikipedia Unavailable:** Using generic context. (Error: {str(e)})"))
-            return f"Standard {genre} film context."
+            display_markdown(f"⚠️ **Wikipedia Unavailable:** Using generic context. (Error: {str(e)})")
+            return None
 
     def fetch_script_data(self, genre: str) -> str:
         """Fetch script snippets from a mock database."""
@@ -267,8 +888,8 @@ Highly detailed and cinematic.
         return mock_scripts.get(genre.lower(), "Sample script dialogue.")
 
     def analyze_mood(self, storyboard: Dict) -> Dict:
-        """Analyze mood distribution in the storyboard."""
-        moods = [scene.get("mood", "unknown") for scene in storyboard.get("scenes", [])]
+        """Analyze mood distribution in the storyboard; placeholder scenes have no real mood and are left out."""
+        moods = [scene.get("mood", "unknown") for scene in storyboard.get("scenes", []) if not scene.get("placeholder")]
         return {mood: moods.count(mood) for mood in set(moods)} if moods else {}
 
     def validate_storyboard(self, storyboard: Dict) -> bool:
@@ -277,56 +898,51 @@ Highly detailed and cinematic.
             return False
         if not isinstance(storyboard["scenes"], list) or not storyboard["scenes"]:
             return False
-        for scene in storyboard["scenes"]:
-            if not all(key in scene for key in ["scene_number", "description", "dialogue", "mood"]):
-                return False
-            if scene["mood"] not in CONFIG["moods"]:
-                return False
-        return True
+        return all(self._validate_scene(scene) for scene in storyboard["scenes"])
+
+    def _validate_scene(self, scene: Dict) -> bool:
+        """Validate a single scene's structure and mood (placeholder scenes keep their "neutral" marker)."""
+        if not isinstance(scene, dict) or not all(key in scene for key in ["scene_number", "description", "dialogue", "mood"]):
+            return False
+        return scene["mood"] in CONFIG["moods"] or bool(scene.get("placeholder"))
 
     def save_storyboard(self, storyboard: Dict, filename: str) -> bool:
         """Save the storyboard to a JSON file."""
         try:
             print(f"Saving storyboard to: {filename}")
             os.makedirs(os.path.dirname(filename), exist_ok=True)
-            with open(filename, 'w') as f:
+            with tracing.span("save_storyboard") as span, open(filename, 'w') as f:
                 json.dump(storyboard, f, indent=2)
+                span.set(bytes=f.tell())
+            tracing.inc("bytes_written_total", os.path.getsize(filename), kind="storyboard")
             print(f"Successfully saved storyboard to: {filename}")
             return True
         except Exception as e:
             print(f"Error saving storyboard to {filename}: {str(e)}")
-            display(Markdown(f"⚠️ **Error saving storyboard:** {str(e)}"))
+            display_markdown(f"⚠️ **Error saving storyboard:** {str(e)}")
             return False
 
-    def retrieve_similar_plots(self, plot: str, top_k: int = 3) -> List[Dict]:
-        """Retrieve similar plots using vector similarity."""
-        if not self.embedding_model:
-            return []
-        with open(self.knowledge_base_path, "r") as f:
-            kb = json.load(f)
-        if not kb["plots"]:
+    def retrieve_similar_plots(self, plot: str, top_k: int = 3, visual_style: str = None) -> List[Dict]:
+        """Retrieve similar plots using vector similarity.
+
+        Only the knowledge base shards selected by CONFIG["kb_search_scope"] are searched.
+        """
+        self.knowledge_base.refresh()
+        scope = CONFIG["kb_search_scope"]
+        searched = self.knowledge_base.size(plot, visual_style, scope)
+        if not searched or not self.embedding_model:
             return []
-        plot_embedding = self.embedding_model.encode(plot)
-        similarities = []
-        for stored_plot in kb["plots"]:
-            stored_embedding = np.array(stored_plot["embedding"])
-            similarity = cosine_similarity([plot_embedding], [stored_embedding])[0][0]
-            similarities.append((stored_plot, similarity))
-        return [plot for plot, sim in sorted(similarities, key=lambda x: x[1], reverse=True) if sim > CONFIG["rag_threshold"]][:top_k]
-
-    def _update_knowledge_base(self, plot: str, storyboard: Dict):
+        plot_embedding = self._embed(plot)
+        with tracing.span("vector_search", index_size=searched, scope=scope) as span:
+            matches = self.knowledge_base.search(plot_embedding, top_k, CONFIG["rag_threshold"], plot, visual_style, scope)
+            span.set(matches=len(matches))
+        return [record for record, sim in matches]
+
+    def _update_knowledge_base(self, plot: str, storyboard: Dict, visual_style: str = None, output_dir: str = None):
         """Update the knowledge base with a new plot and storyboard."""
         try:
-            with open(self.knowledge_base_path, "r") as f:
-                kb = json.load(f)
-            plot_embedding = self.embedding_model.encode(plot).tolist() if self.embedding_model else []
-            kb["plots"].append({
-                "plot": plot,
-                "storyboard": storyboard,
-                "embedding": plot_embedding,
-                "timestamp": str(datetime.now())
-            })
-            with open(self.knowledge_base_path, "w") as f:
-                json.dump(kb, f, indent=2)
+            plot_embedding = self._embed(plot)
+            with tracing.span("kb_write"):
+                self.knowledge_base.append(plot, storyboard, plot_embedding, visual_style=visual_style, output_dir=output_dir)
         except Exception as e:
-            display(Markdown(f"⚠️ Could not update knowledge base: {e}"))
\ No newline at end of file
+            display_markdown(f"⚠️ Could not update knowledge base: {e}")
@@ -0,0 +1,129 @@
+import argparse
+import csv
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+from .config import CONFIG
+from .ui import create_agent, save_story_outputs
+from .utils import story_folder_name, story_id
+from . import tracing
+
+def load_jobs(jobs_path: str) -> List[Dict]:
+    """Load (plot, num_scenes, visual_style) jobs from a JSONL or CSV file."""
+    with open(jobs_path, "r", newline="", encoding="utf-8") as f:
+        if jobs_path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    jobs = []
+    for row in rows:
+        plot = (row.get("plot") or "").strip()
+        if not plot:
+            continue
+        num_scenes = min(max(int(row.get("num_scenes") or 3), 1), CONFIG["max_scenes"])
+        visual_style = (row.get("visual_style") or "Cinematic").strip()
+        jobs.append({
+            "job_id": row.get("job_id") or story_id(plot, num_scenes, visual_style),
+            "plot": plot,
+            "num_scenes": num_scenes,
+            "visual_style": visual_style
+        })
+    return jobs
+
+class JobStatusFile:
+    """Append-only JSONL log of job states, used to resume a batch after a crash."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def completed(self) -> Dict[str, Dict]:
+        """Return the latest entry of every job whose last recorded status is 'done'."""
+        latest = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Partially written line from a crash
+                    latest[entry["job_id"]] = entry
+        return {job_id: entry for job_id, entry in latest.items() if entry["status"] == "done"}
+
+    def record(self, job_id: str, status: str, **details):
+        entry = {"job_id": job_id, "status": status, "timestamp": str(datetime.now()), **details}
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def run_batch(jobs_path: str, status_path: str = None, job_concurrency: int = None,
+              llm_concurrency: int = None, image_concurrency: int = None, bypass_cache: bool = False) -> Dict[str, int]:
+    """Generate storyboards for every job in jobs_path with a single shared agent.
+
+    Jobs already marked done in the status file are skipped, so an interrupted run can
+    simply be restarted. Returns a count of jobs per final status.
+    """
+    jobs = load_jobs(jobs_path)
+    status_file = JobStatusFile(status_path or f"{os.path.splitext(jobs_path)[0]}.status.jsonl")
+    done = status_file.completed()
+    pending = [job for job in jobs if job["job_id"] not in done]
+    print(f"📋 {len(jobs)} jobs, {len(jobs) - len(pending)} already done, {len(pending)} to run")
+    summary = {"done": len(jobs) - len(pending), "failed": 0}
+    if not pending:
+        return summary
+
+    agent = create_agent(
+        os.path.join(CONFIG["output_dir"], CONFIG["knowledge_base"]),
+        llm_concurrency=llm_concurrency,
+        image_concurrency=image_concurrency
+    )
+
+    def run_job(job: Dict) -> str:
+        folder_name = story_folder_name(job["plot"], job["num_scenes"], job["visual_style"])
+        story_output_dir = os.path.join(CONFIG["output_dir"], folder_name)
+        status_file.record(job["job_id"], "running", story_output_dir=story_output_dir)
+        try:
+            storyboard = agent.generate_storyboard(
+                job["plot"], job["num_scenes"], job["visual_style"], output_dir=story_output_dir,
+                bypass_cache=bypass_cache)
+            if not storyboard:
+                raise ValueError("Storyboard generation failed.")
+            filename = save_story_outputs(agent, storyboard, story_output_dir, folder_name)
+            if not filename:
+                raise ValueError(f"Failed to save storyboard to {story_output_dir}")
+            status_file.record(job["job_id"], "done", story_output_dir=story_output_dir, storyboard=filename)
+            return "done"
+        except Exception as e:
+            print(f"❌ Job {job['job_id']} failed: {str(e)}")
+            status_file.record(job["job_id"], "failed", error=str(e))
+            return "failed"
+
+    with ThreadPoolExecutor(max_workers=job_concurrency or CONFIG["batch_job_concurrency"]) as executor:
+        for status in executor.map(run_job, pending):
+            summary[status] += 1
+    print(f"✅ Batch finished: {summary['done']} done, {summary['failed']} failed")
+    if CONFIG["semantic_reuse"]:
+        report = agent.reuse_report()
+        print(f"🔁 Semantic reuse: {report['hits']}/{report['lookups']} hits ({report['hit_rate']:.0%}) "
+              f"at threshold {report['threshold']}, mean hit similarity {report['mean_hit_similarity']}")
+    tracing.write_metrics()
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate storyboards for a JSONL/CSV file of jobs.")
+    parser.add_argument("jobs", help="JSONL or CSV file with plot, num_scenes and visual_style columns")
+    parser.add_argument("--status-file", help="Job status log used for resuming (default: <jobs>.status.jsonl)")
+    parser.add_argument("--job-concurrency", type=int, help="Storyboards generated at once")
+    parser.add_argument("--llm-concurrency", type=int, help="Maximum in-flight LLM calls")
+    parser.add_argument("--image-concurrency", type=int, help="Maximum in-flight image calls")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore cached storyboards and images")
+    args = parser.parse_args()
+    run_batch(args.jobs, args.status_file, args.job_concurrency, args.llm_concurrency, args.image_concurrency,
+              bypass_cache=args.no_cache)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,95 @@
-import matplotlib.colors as mcolors
-
 CONFIG = {
     "max_scenes": 5,
     "moods": ["tense", "joyful", "romantic", "suspenseful", "chaotic", "dark", "hopeful"],
+    # Off-list moods models commonly return, mapped to the nearest allowed mood
+    "mood_aliases": {"happy": "joyful", "cheerful": "joyful", "sad": "dark", "melancholic": "dark",
+                     "ominous": "dark", "scary": "suspenseful", "mysterious": "suspenseful",
+                     "anxious": "tense", "dramatic": "tense", "action": "chaotic", "frantic": "chaotic",
+                     "loving": "romantic", "uplifting": "hopeful", "optimistic": "hopeful"},
     "context_length": 300,
-    "colors": list(mcolors.TABLEAU_COLORS.values()),
+    # matplotlib's TABLEAU_COLORS, inlined so importing the config does not load matplotlib
+    "colors": ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
+               "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"],
     "max_retries": 3,
+    "image_concurrency": 5,
+    "llm_concurrency": 4,
+    "batch_job_concurrency": 4,
+    "server_host": "127.0.0.1",
+    "server_port": 8080,
+    "server_job_concurrency": 4,
+    "server_max_queued": 32,
+    "server_max_connections": 64,
+    "server_job_history": 500,
+    "server_keepalive": 15,
+    "server_retry_after": 5,
+    "server_access_log": False,
+    "http_timeout": 60,
+    "http_pool_size": 20,
+    "http_max_retries": 4,
+    "backoff_base": 1.0,
+    "backoff_max": 30.0,
+    # A Retry-After longer than this fails the call instead of waiting
+    "retry_after_max": 120.0,
     "rag_threshold": 0.7,
+    "semantic_reuse": False,
+    "semantic_reuse_threshold": 0.92,
+    # Recent lookups whose best similarity is kept for reuse_report
+    "reuse_stats_window": 1000,
     "knowledge_base": "knowledge_base.json",
     "embedding_model": "all-MiniLM-L6-v2",
+    "embedding_memo_size": 256,
+    "kb_shard_by": ["genre", "visual_style"],
+    "kb_search_scope": "genre",
+    "kb_search_workers": None,
+    "ingest_batch_size": 64,
+    "ingest_workers": 1,
     "default_genre": "drama",
-    "output_dir": "outputs" 
+    "output_dir": "outputs",
+    "stream_scenes": True,
+    "wikipedia_base_url": "https://en.wikipedia.org/wiki",
+    "context_cache_path": "outputs/.cache/genre_context.json",
+    "context_cache_ttl": 7 * 24 * 3600,
+    "context_cache_offline": False,
+    "context_cache_warm_file": None,
+    "result_cache_dir": "outputs/.cache/results",
+    "result_cache_max_bytes": 2 * 1024 ** 3,
+    "result_cache_low_water": 0.9,
+    # Image prompt rewrite tiers; each content-policy retry applies one more tier (see src/sanitizer.py).
+    # sanitizer_terms_file, if set, is a JSON file {"levels": [...]} that replaces these tiers.
+    "sanitizer_terms_file": None,
+    "sanitizer_terms": [
+        {"murder": "mysterious event", "kill": "confront", "knife": "object", "blood": "shadow",
+         "violent": "tense", "death": "disappearance", "wet dress": "rain-soaked clothing",
+         "dress adhering to her form": "clothing damp from rain"},
+        {"murdered": "vanished", "murderer": "stranger", "killed": "defeated", "killer": "stranger",
+         "killing": "confrontation", "knives": "objects", "bloody": "shadowy", "dead": "still",
+         "corpse": "figure", "body": "figure", "gun": "prop", "guns": "props", "weapon": "tool",
+         "weapons": "tools", "shoot": "aim", "shot": "flash", "stab": "lunge", "stabbed": "startled",
+         "attack": "approach", "attacks": "approaches", "fight": "standoff", "violence": "tension",
+         "wound": "mark", "wounded": "weary", "naked": "unadorned", "nude": "unadorned"},
+        {"murder": "mystery", "kill": "face", "confront": "face", "blood": "light", "death": "absence",
+         "war": "conflict", "battle": "contest", "explosion": "burst of light", "fire": "glow",
+         "scream": "call", "screams": "calls", "terror": "unease", "horror": "unease", "victim": "person",
+         "criminal": "figure", "thief": "figure", "villain": "rival", "police": "officials",
+         "prison": "building", "drug": "substance", "drugs": "substances", "drunk": "tired",
+         "kiss": "embrace", "lingerie": "clothing", "seductive": "elegant"}
+    ],
+    "tracing": False,
+    "render_backend": "auto",
+    "image_variants": True,
+    "image_formats": ["webp"],
+    "image_quality": 80,
+    "thumbnail_size": 256,
+    # Processes that encode image variants; 0 encodes in-process, None starts one per CPU
+    # (spawned, so the calling script needs an `if __name__ == "__main__":` guard)
+    "image_workers": 0,
+    # Run CPU-bound stages (embedding, HTML parsing, charts, large KB searches, image encoding)
+    # in one spawned process pool; see src/cpu_pool.py
+    "cpu_pool": False,
+    "cpu_workers": None,
+    "cpu_worker_threads": 1,
+    "cpu_pool_share_model": True,
+    "cpu_pool_min_search_rows": 20000,
+    "storyboard_page": "storyboard.html",
+    "metrics_path": "outputs/metrics.prom"
 }
\ No newline at end of file
@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from .config import CONFIG
+from . import tracing
+
+class ContextCache:
+    """Two-level cache for genre context: in-process LRU backed by a persistent JSON store.
+
+    Entries older than `ttl` seconds are refetched. Entries past `refresh_ahead` of their
+    TTL are served immediately and refreshed in a background thread. In offline mode the
+    fetcher is never called and only cached (or warmed) values are returned.
+    """
+
+    def __init__(self, path: str, ttl: float, refresh_ahead: float = 0.8, max_entries: int = 128, offline: bool = False):
+        self.path = path
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.max_entries = max_entries
+        self.offline = offline
+        self._memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._store = self._read_store(path)
+
+    @staticmethod
+    def _read_store(path: str) -> Dict[str, Dict]:
+        """Read a persisted cache file, ignoring it if missing or corrupt."""
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _persist(self):
+        """Atomically write the on-disk store."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._store, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def warm_from_file(self, path: str):
+        """Load entries from a previously exported cache file, e.g. for offline batch runs."""
+        entries = self._read_store(path)
+        with self._lock:
+            self._store.update(entries)
+            for key, entry in entries.items():
+                self._remember(key, entry)
+            self._persist()
+
+    def _remember(self, key: str, entry: Dict):
+        """Insert an entry into the in-process LRU, evicting the least recently used."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, key: str) -> Optional[Dict]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+        entry = self._store.get(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, value: str):
+        """Store a value in both cache levels."""
+        entry = {"value": value, "fetched_at": time.time()}
+        with self._lock:
+            self._remember(key, entry)
+            self._store[key] = entry
+            self._persist()
+
+    def get(self, key: str, fetch: Callable[[], Optional[str]]) -> Optional[str]:
+        """Return the cached value for key, calling fetch() on a miss or after expiry.
+
+        fetch() should return None on failure so that errors are not cached.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+        if entry is not None:
+            age = time.time() - entry["fetched_at"]
+            if self.offline or age < self.ttl * self.refresh_ahead:
+                tracing.inc("context_cache_requests_total", result="hit")
+                return entry["value"]
+            if age < self.ttl:
+                tracing.inc("context_cache_requests_total", result="refresh_ahead")
+                self._refresh_in_background(key, fetch)
+                return entry["value"]
+        tracing.inc("context_cache_requests_total", result="miss")
+        if self.offline:
+            return None
+        value = fetch()
+        if value is None:
+            # Serve a stale value rather than nothing when the source is unavailable
+            return entry["value"] if entry is not None else None
+        self.put(key, value)
+        return value
+
+    def _refresh_in_background(self, key: str, fetch: Callable[[], Optional[str]]):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value = fetch()
+                if value is not None:
+                    self.put(key, value)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+_shared_cache: Optional[ContextCache] = None
+_shared_cache_lock = threading.Lock()
+
+def get_context_cache() -> ContextCache:
+    """Return the process-wide context cache configured from CONFIG."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ContextCache(
+                CONFIG["context_cache_path"],
+                ttl=CONFIG["context_cache_ttl"],
+                offline=CONFIG["context_cache_offline"]
+            )
+            if CONFIG["context_cache_warm_file"]:
+                _shared_cache.warm_from_file(CONFIG["context_cache_warm_file"])
+        return _shared_cache
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+from .config import CONFIG
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def enabled() -> bool:
+    """Whether CPU-bound stages run in the worker pool (CONFIG["cpu_pool"])."""
+    return bool(CONFIG["cpu_pool"])
+
+def get_cpu_pool() -> ProcessPoolExecutor:
+    """Return the process-wide pool for CPU-bound stages, starting it on first use.
+
+    Workers are spawned with a snapshot of CONFIG. With cpu_pool_share_model, the embedding
+    model is loaded here once and its weights moved to shared memory, so every worker maps
+    the same weights instead of loading its own copy.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn for the same reason as the image pool: forking a process running HTTP client threads can deadlock
+            _pool = ProcessPoolExecutor(max_workers=CONFIG["cpu_workers"] or os.cpu_count(),
+                                        mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker, initargs=(dict(CONFIG), _shared_model()))
+        return _pool
+
+def _shared_model():
+    """The embedding model with its weights in shared memory, or None to let each worker load its own."""
+    if not CONFIG["cpu_pool_share_model"]:
+        return None
+    try:
+        # Registers pickling of shared tensors as handles, so the weights are not copied to workers
+        import torch.multiprocessing  # noqa: F401
+    except ImportError:
+        return None
+    from .models import get_embedding_model
+    model = get_embedding_model(CONFIG["embedding_model"])
+    if model is None:
+        return None
+    model.share_memory()
+    return model
+
+def _init_worker(config: dict, shared_model):
+    CONFIG.update(config)
+    if shared_model is not None:
+        from .models import set_embedding_model
+        set_embedding_model(CONFIG["embedding_model"], shared_model)
+    if "torch" in sys.modules:
+        # One intra-op thread per worker, so adding workers scales with cores instead of oversubscribing them
+        import torch
+        torch.set_num_threads(CONFIG["cpu_worker_threads"])
+
+def submit(fn, *args) -> Future:
+    """Run fn(*args) in a CPU worker, or inline when the pool is disabled; fn and args must be picklable."""
+    if not enabled():
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return get_cpu_pool().submit(fn, *args)
+
+def run(fn, *args):
+    """Call fn(*args) through submit and wait for the result."""
+    return submit(fn, *args).result()
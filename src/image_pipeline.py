@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional
+from .config import CONFIG
+from . import cpu_pool
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# Pillow format names and file extensions of the compressed variants
+FORMATS = {"webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+
+def get_image_pool() -> ProcessPoolExecutor:
+    """Return the process-wide pool that runs CPU-bound image encoding off the generation threads."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, because forking a process that runs HTTP client threads can deadlock;
+            # scripts that generate storyboards therefore need an `if __name__ == "__main__":` guard
+            _pool = ProcessPoolExecutor(max_workers=CONFIG["image_workers"] or os.cpu_count(),
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _submit(fn, *args) -> Future:
+    """Run fn on the image pool, on the shared CPU pool when enabled, or inline when CONFIG["image_workers"] is 0."""
+    if cpu_pool.enabled():
+        return cpu_pool.submit(fn, *args)
+    if CONFIG["image_workers"] == 0:
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return get_image_pool().submit(fn, *args)
+
+def _save_atomic(image, path: str, image_format: str, **options):
+    # A temporary name of its own, since identical jobs may encode the same story folder at once
+    tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        image.save(tmp_path, format=image_format, **options)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def encode_variants(image_path: str, formats: List[str], quality: int, thumbnail_size: int) -> Dict[str, str]:
+    """Write compressed copies and a JPEG thumbnail next to image_path; returns variant filenames by kind.
+
+    Runs in a pool worker, so it only takes and returns picklable values.
+    """
+    from PIL import Image
+    base, _ = os.path.splitext(image_path)
+    variants = {}
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+        for kind in formats:
+            image_format, extension = FORMATS[kind]
+            _save_atomic(image, base + extension, image_format, quality=quality)
+            variants[kind] = os.path.basename(base + extension)
+        image.thumbnail((thumbnail_size, thumbnail_size))
+        _save_atomic(image, f"{base}_thumb.jpg", "JPEG", quality=quality)
+        variants["thumbnail"] = os.path.basename(f"{base}_thumb.jpg")
+    return variants
+
+def build_contact_sheet(image_paths: List[str], labels: List[str], output_path: str, tile_size: int,
+                        quality: int) -> str:
+    """Tile the images (scaled to tile_size) into one labelled JPEG grid; returns output_path."""
+    from PIL import Image, ImageDraw
+    columns = min(len(image_paths), 3)
+    rows = -(-len(image_paths) // columns)
+    label_height = 28
+    sheet = Image.new("RGB", (columns * tile_size, rows * (tile_size + label_height)), "white")
+    draw = ImageDraw.Draw(sheet)
+    for i, (path, label) in enumerate(zip(image_paths, labels)):
+        x, y = (i % columns) * tile_size, (i // columns) * (tile_size + label_height)
+        with Image.open(path) as image:
+            image = image.convert("RGB")
+            image.thumbnail((tile_size, tile_size))
+            sheet.paste(image, (x + (tile_size - image.width) // 2, y + (tile_size - image.height) // 2))
+        draw.text((x + tile_size // 2, y + tile_size + label_height // 2), label, fill="black", anchor="mm")
+    _save_atomic(sheet, output_path, "JPEG", quality=quality)
+    return output_path
+
+def render_placeholder(path: str, size: int = 1024):
+    """Draw the gray "Image Not Generated" placeholder PNG."""
+    from PIL import Image, ImageDraw, ImageFont
+    image = Image.new('RGB', (size, size), color='gray')
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.truetype("arial.ttf", 40)
+    except OSError:
+        font = ImageFont.load_default()
+    draw.text((50, 450), "Image Not Generated", fill='white', font=font)
+    _save_atomic(image, path, "PNG")
+
+def submit_variants(image_path: str) -> Future:
+    """Queue encode_variants for image_path on the image pool with the configured formats."""
+    return _submit(encode_variants, image_path, CONFIG["image_formats"], CONFIG["image_quality"],
+                   CONFIG["thumbnail_size"])
+
+def submit_contact_sheet(storyboard: Dict, output_dir: str) -> Optional[Future]:
+    """Queue a contact sheet of the storyboard's scene images; None if no scene has an image."""
+    scenes = [scene for scene in storyboard.get("scenes", [])
+              if scene.get("image_filename") and os.path.exists(os.path.join(output_dir, scene["image_filename"]))]
+    if not scenes:
+        return None
+    image_paths = [os.path.join(output_dir, scene.get("image_variants", {}).get("thumbnail") or scene["image_filename"])
+                   for scene in scenes]
+    labels = [f"Scene {scene.get('scene_number', i + 1)} ({scene.get('mood', 'neutral')})" for i, scene in enumerate(scenes)]
+    return _submit(build_contact_sheet, image_paths, labels, os.path.join(output_dir, "contact_sheet.jpg"),
+                   CONFIG["thumbnail_size"], CONFIG["image_quality"])
@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+from .config import CONFIG
+from .knowledge_base import KnowledgeBase
+from .models import get_embedding_model
+from .utils import init_knowledge_base
+
+class BatchEncoder:
+    """Encode texts in batches, fanning out to a SentenceTransformer multi-process pool when workers > 1."""
+
+    def __init__(self, model, batch_size: int = None, workers: int = None):
+        self.model = model
+        self.batch_size = batch_size or CONFIG["ingest_batch_size"]
+        self.workers = workers or CONFIG["ingest_workers"]
+        self._pool = None
+
+    def __enter__(self):
+        if self.workers > 1 and hasattr(self.model, "start_multi_process_pool"):
+            self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        if self._pool is not None:
+            return self.model.encode_multi_process(texts, self._pool, batch_size=self.batch_size)
+        return np.asarray(self.model.encode(texts, batch_size=self.batch_size))
+
+def _load_model(model_name: str):
+    model = get_embedding_model(model_name)
+    if model is None:
+        raise ValueError(f"Embedding model {model_name} could not be loaded")
+    return model
+
+def _report(label: str, done: int, total: int, started: float):
+    rate = done / max(time.perf_counter() - started, 1e-9)
+    print(f"⏳ {label}: {done}/{total} plots ({rate:.0f}/s)", flush=True)
+
+def load_plot_records(path: str) -> List[Dict]:
+    """Read plot records from a JSONL file, a JSON list or a legacy {"plots": [...]} file."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(".jsonl"):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            data = json.load(f)
+            records = data.get("plots", []) if isinstance(data, dict) else data
+    return [record for record in records if isinstance(record, dict) and record.get("plot")]
+
+def ingest(knowledge_base_path: str, sources: List[str], model_name: str = None, batch_size: int = None,
+           workers: int = None, chunk_size: int = 1024) -> int:
+    """Bulk-append plot records from sources into their shards, encoding plots in batches; returns the number added."""
+    knowledge_base = init_knowledge_base(knowledge_base_path)
+    records = [record for source in sources for record in load_plot_records(source)]
+    started = time.perf_counter()
+    with BatchEncoder(_load_model(model_name or CONFIG["embedding_model"]), batch_size, workers) as encoder:
+        for start in range(0, len(records), chunk_size):
+            chunk = [{k: v for k, v in record.items() if k != "embedding" and not k.startswith("embedding_")}
+                     for record in records[start:start + chunk_size]]
+            for record in chunk:
+                record.setdefault("storyboard", {})
+                record.setdefault("timestamp", str(datetime.now()))
+            embeddings = encoder.encode([record["plot"] for record in chunk])
+            knowledge_base.append_many(list(zip(chunk, embeddings)))
+            _report("Ingested", start + len(chunk), len(records), started)
+    return len(records)
+
+def _write_chunk(rec_file, emb_file, records: List[Dict], encoder: BatchEncoder):
+    embeddings = encoder.encode([record["plot"] for record in records])
+    for record, embedding in zip(records, embeddings):
+        stripped = {k: v for k, v in record.items() if not k.startswith("embedding_")}
+        KnowledgeBase._write_record(rec_file, emb_file, stripped, embedding)
+    for f in (rec_file, emb_file):
+        f.flush()
+        os.fsync(f.fileno())
+
+def _save_checkpoint(path: str, checkpoint: Dict):
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(f"{path}.tmp", path)
+
+def _load_checkpoint(path: str, model_name: str) -> Optional[Dict]:
+    try:
+        with open(path, "r") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return checkpoint if checkpoint.get("model") == model_name else None
+
+def reindex(knowledge_base_path: str, model_name: str = None, batch_size: int = None, workers: int = None,
+            checkpoint_every: int = 1024) -> int:
+    """Rebuild the embeddings of every shard of the shared knowledge base; returns the plot count."""
+    return sum(reindex_shard(path, model_name, batch_size, workers, checkpoint_every)
+               for path in init_knowledge_base(knowledge_base_path).shard_paths())
+
+def reindex_shard(knowledge_base_path: str, model_name: str = None, batch_size: int = None, workers: int = None,
+                  checkpoint_every: int = 1024) -> int:
+    """Rebuild every embedding in one knowledge base file with model_name (which may change the dimension).
+
+    New records and embeddings are written beside the live files and swapped in at the end,
+    so readers keep working throughout. Progress is checkpointed every checkpoint_every plots;
+    rerunning after an interruption resumes from the last checkpoint. Returns the plot count.
+    """
+    model_name = model_name or CONFIG["embedding_model"]
+    knowledge_base = KnowledgeBase(knowledge_base_path)
+    records_tmp = f"{knowledge_base.records_path}.reindex"
+    embeddings_tmp = f"{knowledge_base.embeddings_path}.reindex"
+    checkpoint_path = f"{os.path.splitext(knowledge_base.records_path)[0]}.reindex.json"
+    checkpoint = _load_checkpoint(checkpoint_path, model_name)
+    if checkpoint is None or not (os.path.exists(records_tmp) and os.path.exists(embeddings_tmp)):
+        checkpoint = {"model": model_name, "source_offset": 0, "records_bytes": 0, "embeddings_bytes": 0, "done": 0}
+    else:
+        print(f"↩️ Resuming re-index at plot {checkpoint['done']}")
+    # Drop anything written after the last checkpoint
+    for path, size in ((records_tmp, checkpoint["records_bytes"]), (embeddings_tmp, checkpoint["embeddings_bytes"])):
+        with open(path, "ab") as f:
+            f.truncate(size)
+    with open(knowledge_base.records_path, "rb") as f:
+        total = sum(1 for line in f if line.strip())
+    started = time.perf_counter()
+    offset, done = checkpoint["source_offset"], checkpoint["done"]
+    with BatchEncoder(_load_model(model_name), batch_size, workers) as encoder:
+        while True:
+            records, next_offset = knowledge_base.read_records(offset, max_records=checkpoint_every)
+            if not records:
+                break
+            with open(records_tmp, "a") as rec_file, open(embeddings_tmp, "ab") as emb_file:
+                _write_chunk(rec_file, emb_file, records, encoder)
+            offset, done = next_offset, done + len(records)
+            _save_checkpoint(checkpoint_path, {
+                "model": model_name, "source_offset": offset, "done": done,
+                "records_bytes": os.path.getsize(records_tmp), "embeddings_bytes": os.path.getsize(embeddings_tmp)
+            })
+            _report("Re-indexed", done, max(total, done), started)
+        with knowledge_base.lock():
+            # Pick up plots appended while re-indexing, then swap the rebuilt files in
+            records, offset = knowledge_base.read_records(offset)
+            with open(records_tmp, "a") as rec_file, open(embeddings_tmp, "ab") as emb_file:
+                _write_chunk(rec_file, emb_file, records, encoder)
+            done += len(records)
+            # Readers that see either file replaced re-read both under this lock, so they never see a mixed pair
+            os.replace(embeddings_tmp, knowledge_base.embeddings_path)
+            os.replace(records_tmp, knowledge_base.records_path)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print(f"✅ Re-indexed {done} plots in {knowledge_base.records_path} with {model_name}")
+    return done
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest plots into a knowledge base or re-index its embeddings.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Append plot records from JSONL/JSON files")
+    ingest_parser.add_argument("sources", nargs="+", help="JSONL, JSON list or legacy knowledge base files")
+    reindex_parser = subparsers.add_parser("reindex", help="Rebuild all embeddings, e.g. with a new model")
+    reindex_parser.add_argument("--checkpoint-every", type=int, default=1024, help="Plots per checkpoint")
+    for sub in (ingest_parser, reindex_parser):
+        sub.add_argument("--knowledge-base", default=os.path.join(CONFIG["output_dir"], CONFIG["knowledge_base"]),
+                         help="Knowledge base path")
+        sub.add_argument("--model", help="Embedding model (default: CONFIG['embedding_model'])")
+        sub.add_argument("--batch-size", type=int, help="Plots per encode batch")
+        sub.add_argument("--workers", type=int, help="CPU encoding processes")
+    args = parser.parse_args()
+    if args.command == "ingest":
+        ingest(args.knowledge_base, args.sources, args.model, args.batch_size, args.workers)
+    else:
+        reindex(args.knowledge_base, args.model, args.batch_size, args.workers, args.checkpoint_every)
+        if args.model and args.model != CONFIG["embedding_model"]:
+            print(f"ℹ️ Set CONFIG['embedding_model'] to {args.model!r} so queries use the new embeddings")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import json
+from typing import Dict, List, Optional
+
+class SceneStreamParser:
+    """Incrementally scan streamed storyboard JSON and emit each scene object as it closes.
+
+    A scene is any object opened directly inside an array of the top-level object, which
+    for the storyboard format is the "scenes" list. Text before the first '{' (such as a
+    code fence) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._scene_start = None
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Consume a chunk of output; returns the scenes completed by it."""
+        self.text += chunk
+        scenes = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif not self._stack:
+                if char == "{":
+                    self._stack.append(char)
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if char == "{" and self._stack == ["{", "["]:
+                    self._scene_start = i
+                self._stack.append(char)
+            elif char in "}]":
+                self._stack.pop()
+                if char == "}" and self._stack == ["{", "["] and self._scene_start is not None:
+                    scene = loads_repaired(text[self._scene_start:i + 1])
+                    if scene is not None:
+                        scenes.append(scene)
+                    self._scene_start = None
+        self._pos = len(text)
+        return scenes
+
+CLOSERS = {"{": "}", "[": "]"}
+
+def repair_json(text: str) -> Optional[str]:
+    """Single-pass repair of the first JSON object in LLM output; None if there is no object.
+
+    Text before the first '{' and after its matching '}' (code fences, prose) is dropped,
+    trailing commas are removed, and output truncated mid-way (e.g. at max_tokens) is cut
+    back to the last complete value and closed.
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = escape = False
+    pending_comma = None
+    # Length of out and open brackets at the last point where the JSON could be closed cleanly
+    safe = (0, [])
+    for char in text[start:]:
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char in "}]":
+            if not stack or CLOSERS[stack[-1]] != char:
+                continue
+            if pending_comma is not None:
+                out[pending_comma] = ""
+            stack.pop()
+            out.append(char)
+            if not stack:
+                return "".join(out)
+            safe, pending_comma = (len(out), list(stack)), None
+            continue
+        if char == ",":
+            safe = (len(out), list(stack))
+            pending_comma = len(out)
+            out.append(char)
+            continue
+        out.append(char)
+        if char.isspace():
+            continue
+        pending_comma = None
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+            safe = (len(out), list(stack))
+    length, open_brackets = safe
+    return "".join(out[:length]) + "".join(CLOSERS[bracket] for bracket in reversed(open_brackets))
+
+def loads_repaired(text: str):
+    """Parse the first JSON object in text after repair_json; None if it cannot be recovered."""
+    repaired = repair_json(text)
+    if repaired is None:
+        return None
+    try:
+        # strict=False accepts raw newlines inside strings, which models often emit
+        return json.loads(repaired, strict=False)
+    except ValueError:
+        return None
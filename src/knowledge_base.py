@@ -0,0 +1,245 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from . import tracing
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# One thread lock per lock file, so writers of different shards never wait on each other
+_thread_locks: Dict[str, threading.Lock] = {}
+_thread_locks_lock = threading.Lock()
+
+def _thread_lock(lock_path: str) -> threading.Lock:
+    with _thread_locks_lock:
+        return _thread_locks.setdefault(os.path.realpath(lock_path), threading.Lock())
+
+@contextmanager
+def _file_lock(lock_path: str):
+    """Hold an exclusive inter-process lock on lock_path."""
+    with _thread_lock(lock_path), open(lock_path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def read_record(records_path: str, offset: int) -> Optional[Dict]:
+    """The record whose line starts at offset in a records file, or None if it cannot be read."""
+    try:
+        with open(records_path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+
+def normalize_embedding(embedding) -> np.ndarray:
+    """Convert an embedding to a unit-length float32 vector."""
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class KnowledgeBase:
+    """Append-only knowledge base: JSONL plot records plus a raw float32 embedding sidecar.
+
+    Each record line stores the row of its embedding in the sidecar file and the sidecar's
+    size after the write, so appends are O(1) and never rewrite earlier history. Writers
+    serialize through a lock file.
+    """
+
+    def __init__(self, knowledge_base_path: str):
+        base = os.path.splitext(knowledge_base_path)[0]
+        self.legacy_path = knowledge_base_path
+        self.records_path = f"{base}.jsonl"
+        self.embeddings_path = f"{base}_embeddings.f32"
+        self.lock_path = f"{base}.lock"
+        os.makedirs(os.path.dirname(self.records_path) or ".", exist_ok=True)
+        with _file_lock(self.lock_path):
+            if not os.path.exists(self.records_path):
+                self._migrate_legacy()
+
+    def _migrate_legacy(self):
+        """One-shot conversion of a legacy {"plots": [...]} JSON file into the append-only format."""
+        plots = []
+        if os.path.exists(self.legacy_path) and self.legacy_path != self.records_path:
+            try:
+                with open(self.legacy_path, "r") as f:
+                    plots = json.load(f).get("plots", [])
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not read legacy knowledge base {self.legacy_path}: {e}")
+                return
+        with open(self.embeddings_path, "wb") as emb_file, open(f"{self.records_path}.tmp", "w") as rec_file:
+            for plot in plots:
+                embedding = plot.pop("embedding", None)
+                self._write_record(rec_file, emb_file, plot, embedding)
+        os.replace(f"{self.records_path}.tmp", self.records_path)
+        if plots:
+            os.replace(self.legacy_path, f"{self.legacy_path}.migrated")
+            print(f"Migrated {len(plots)} plots from {self.legacy_path} to {self.records_path}")
+
+    @staticmethod
+    def _write_record(rec_file, emb_file, record: Dict, embedding, dim: int = None) -> Dict:
+        """Write one embedding row (if any) and its record line to the open files.
+
+        dim is the dimension of the rows already in the sidecar; an embedding of another
+        dimension would misalign every later row, so the record is stored without it.
+        """
+        record = dict(record)
+        record["embedding_row"] = None
+        emb_file.seek(0, os.SEEK_END)
+        end = emb_file.tell()
+        if embedding is not None and len(embedding):
+            vector = normalize_embedding(embedding)
+            row_bytes = 4 * vector.shape[0]
+            if (dim and vector.shape[0] != dim) or end % row_bytes:
+                print(f"⚠️ Storing plot without its {vector.shape[0]}-dimensional embedding: "
+                      f"the embedding file holds {dim or 'other'}-dimensional rows")
+            else:
+                record["embedding_row"] = end // row_bytes
+                record["embedding_dim"] = int(vector.shape[0])
+                emb_file.write(vector.tobytes())
+                emb_file.flush()
+                end += row_bytes
+        if record["embedding_row"] is None and dim:
+            record["embedding_dim"] = dim  # Lets the next writer check dimensions from the last record alone
+        record["embedding_end"] = end
+        line = json.dumps(record) + "\n"
+        rec_file.write(line)
+        rec_file.flush()
+        tracing.inc("bytes_written_total", len(line) + 4 * (record.get("embedding_dim") or 0), kind="knowledge_base")
+        return record
+
+    def append(self, plot: str, storyboard: Dict, embedding=None, **extra) -> Dict:
+        """Append a plot record (and its embedding) to the knowledge base."""
+        record = {"plot": plot, "storyboard": storyboard, "timestamp": str(datetime.now()), **extra}
+        with _file_lock(self.lock_path):
+            dim = self._repair_tail()
+            with open(self.embeddings_path, "ab") as emb_file, open(self.records_path, "a") as rec_file:
+                return self._write_record(rec_file, emb_file, record, embedding, dim)
+
+    def append_many(self, entries: List[Tuple[Dict, Optional[np.ndarray]]]) -> List[Dict]:
+        """Append (record, embedding) pairs under a single lock acquisition."""
+        with _file_lock(self.lock_path):
+            dim = self._repair_tail()
+            written = []
+            with open(self.embeddings_path, "ab") as emb_file, open(self.records_path, "a") as rec_file:
+                for record, embedding in entries:
+                    written.append(self._write_record(rec_file, emb_file, record, embedding, dim))
+                    dim = dim or written[-1].get("embedding_dim")
+            return written
+
+    def _last_record(self) -> Optional[Dict]:
+        """The last complete record, after truncating a torn final line left by a crashed writer."""
+        if not os.path.exists(self.records_path):
+            return None
+        with open(self.records_path, "r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            chunk = 4096
+            while True:
+                start = max(0, size - chunk)
+                f.seek(start)
+                data = f.read()
+                end = data.rfind(b"\n") + 1
+                if start + end < size:
+                    print(f"⚠️ Dropping an incomplete record at the end of {self.records_path}")
+                    f.truncate(start + end)
+                    size = start + end
+                    continue
+                # When reading from mid-file, the first line may be cut off
+                lines = [line for line in data[:end].split(b"\n")[1 if start else 0:] if line.strip()]
+                if lines:
+                    return json.loads(lines[-1])
+                if start == 0:
+                    return None
+                chunk *= 4
+
+    def _repair_tail(self) -> Optional[int]:
+        """Drop sidecar rows that have no record line; returns the sidecar's embedding dimension.
+
+        A writer that crashes between writing an embedding row and its record leaves an orphan
+        row, which would shift the row number of every later record. Must hold the lock.
+        """
+        record = self._last_record()
+        if record is None:
+            expected, dim = 0, None
+        elif record.get("embedding_end") is not None:
+            expected, dim = record["embedding_end"], record.get("embedding_dim")
+        elif record.get("embedding_row") is not None:
+            dim = record["embedding_dim"]
+            expected = (record["embedding_row"] + 1) * 4 * dim
+        else:
+            return None  # Legacy record without embedding bookkeeping; nothing to check against
+        if os.path.exists(self.embeddings_path) and os.path.getsize(self.embeddings_path) > expected:
+            print(f"⚠️ Truncating {os.path.getsize(self.embeddings_path) - expected} orphaned bytes "
+                  f"from {self.embeddings_path}")
+            with open(self.embeddings_path, "r+b") as f:
+                f.truncate(expected)
+        return dim
+
+    def read_records(self, offset: int = 0, max_records: int = None) -> Tuple[List[Dict], int]:
+        """Read complete record lines starting at a byte offset; returns (records, next_offset).
+
+        With max_records, reading stops after that many records instead of at the end of the file.
+        """
+        if not os.path.exists(self.records_path):
+            return [], offset
+        if max_records is not None:
+            entries, offset = self.read_entries(offset, max_records)
+            return [record for _, record in entries], offset
+        with open(self.records_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        return records, offset + end
+
+    def read_entries(self, offset: int = 0, max_records: int = None) -> Tuple[List[Tuple[int, Dict]], int]:
+        """read_records, with each record paired with the byte offset of its line."""
+        entries = []
+        if not os.path.exists(self.records_path):
+            return entries, offset
+        with open(self.records_path, "rb") as f:
+            f.seek(offset)
+            while max_records is None or len(entries) < max_records:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                if line.strip():
+                    entries.append((offset, json.loads(line)))
+                offset += len(line)
+        return entries, offset
+
+    def load_embeddings(self, dim: int, rows: int) -> np.ndarray:
+        """Memory-map the first `rows` embedding rows of the sidecar file."""
+        if not rows or not dim:
+            return np.zeros((0, dim or 0), dtype=np.float32)
+        return np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(rows, dim))
+
+    def lock(self):
+        """Exclusive lock that every writer of this knowledge base holds."""
+        return _file_lock(self.lock_path)
+
+    def file_id(self) -> Optional[Tuple[Tuple[int, int], ...]]:
+        """Identity of the records and sidecar files, which changes when either is replaced by a rebuild."""
+        try:
+            return tuple((stat.st_dev, stat.st_ino) for stat in map(os.stat, (self.records_path, self.embeddings_path)))
+        except OSError:
+            return None
+
+    def __len__(self) -> int:
+        return len(self.read_records()[0])
@@ -0,0 +1,31 @@
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+
+_embedding_models: Dict[str, object] = {}
+_embedding_models_lock = threading.Lock()
+
+def get_embedding_model(name: str):
+    """Return the process-wide SentenceTransformer for name, loading it on first use.
+
+    Returns None if the model cannot be loaded; the failure is reported once.
+    """
+    with _embedding_models_lock:
+        if name not in _embedding_models:
+            try:
+                from sentence_transformers import SentenceTransformer
+                _embedding_models[name] = SentenceTransformer(name)
+            except Exception as e:
+                print(f"⚠️ Could not load embedding model: {e}")
+                _embedding_models[name] = None
+        return _embedding_models[name]
+
+def set_embedding_model(name: str, model):
+    """Use an already loaded model for name, e.g. one whose weights a CPU pool worker received in shared memory."""
+    with _embedding_models_lock:
+        _embedding_models[name] = model
+
+def encode_texts(name: str, texts: List[str]) -> Optional[np.ndarray]:
+    """Encode texts with the process-wide model for name; None if it cannot be loaded. Runs in CPU pool workers."""
+    model = get_embedding_model(name)
+    return None if model is None else np.asarray(model.encode(texts))
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Optional
+from .config import CONFIG
+from . import tracing
+
+class ResultCache:
+    """Content-addressed on-disk cache for generated images and storyboards.
+
+    Entries are stored under the SHA-256 of their inputs. Hits refresh the entry's mtime.
+    The running size is tracked in memory, and once it grows past max_bytes the least
+    recently used entries are evicted down to low_water * max_bytes, so the cache tree is
+    only walked again after another (1 - low_water) of growth.
+    """
+
+    def __init__(self, root: str, max_bytes: int, low_water: float = 0.9):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._size = None
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Hash the inputs that determine a result into a cache key."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}{suffix}")
+
+    def get_file(self, key: str, suffix: str) -> Optional[str]:
+        """Return the cached file path for key, or None on a miss."""
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)
+        except OSError:
+            tracing.inc("result_cache_requests_total", kind=suffix.lstrip("."), result="miss")
+            return None
+        tracing.inc("result_cache_requests_total", kind=suffix.lstrip("."), result="hit")
+        return path
+
+    def put_file(self, key: str, suffix: str, source_path: str) -> str:
+        """Store a copy of source_path under key; returns the cached path."""
+        path = self._path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        self.link_into(source_path, tmp_path)
+        os.replace(tmp_path, path)
+        self._added(os.path.getsize(path))
+        return path
+
+    def get_json(self, key: str) -> Optional[Dict]:
+        """Return the cached JSON document for key, or None on a miss."""
+        path = self.get_file(key, ".json")
+        if path is None:
+            return None
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put_json(self, key: str, data: Dict):
+        """Store a JSON document under key."""
+        path = self._path(key, ".json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        self._added(os.path.getsize(path))
+
+    @staticmethod
+    def link_into(source_path: str, dest_path: str):
+        """Hard-link source_path to dest_path, copying when links are not supported.
+
+        Writers must replace files atomically rather than write in place, since a linked
+        file shares its contents with the cache entry.
+        """
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(source_path, dest_path)
+        except OSError:
+            shutil.copy2(source_path, dest_path)
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _added(self, size: int):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry_size for _, entry_size, _ in self._entries())
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is back under its low-water mark."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.low_water
+        for path, size, _ in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except OSError:
+                pass
+
+_shared_cache: Optional[ResultCache] = None
+_shared_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    """Return the process-wide result cache configured from CONFIG."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResultCache(CONFIG["result_cache_dir"], CONFIG["result_cache_max_bytes"],
+                                        CONFIG["result_cache_low_water"])
+        return _shared_cache
@@ -0,0 +1,102 @@
+import json
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+from . import tracing
+from .config import CONFIG
+
+class PromptSanitizer:
+    """Rewrites sensitive terms in image prompts in one regex pass per call, keeping the original case.
+
+    levels is a list of {term: replacement} tiers. Rewriting at level n applies tiers 1..n,
+    a later tier overriding an earlier one for the same term, so each level is stricter
+    than the last while leaving the rest of the prompt intact. Each level is compiled once
+    into a single trie-shaped regex, preferring the longest term so phrases win over their words.
+    """
+
+    def __init__(self, levels: List[Dict[str, str]]):
+        self._levels: List[Tuple[Optional[re.Pattern], Dict[str, str]]] = []
+        replacements: Dict[str, str] = {}
+        for tier in levels:
+            replacements = {**replacements, **{_normalize(term): replacement for term, replacement in tier.items()}}
+            self._levels.append((_compile(replacements), replacements))
+
+    @property
+    def levels(self) -> int:
+        return len(self._levels)
+
+    def sanitize(self, prompt: str, level: int = 1) -> str:
+        """Rewrite prompt at level (1 = mildest; clamped to the strictest available)."""
+        if not self._levels or level < 1:
+            return prompt
+        pattern, replacements = self._levels[min(level, self.levels) - 1]
+        if pattern is None:
+            return prompt
+        sanitized, count = pattern.subn(lambda match: _match_case(match.group(0), replacements[_normalize(match.group(0))]),
+                                        prompt)
+        if count:
+            tracing.inc("prompt_terms_rewritten_total", count, level=level)
+        return sanitized
+
+def _normalize(term: str) -> str:
+    return " ".join(term.lower().split())
+
+def _compile(replacements: Dict[str, str]) -> Optional[re.Pattern]:
+    if not replacements:
+        return None
+    trie: Dict = {}
+    for term in replacements:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return re.compile(r"\b" + _trie_pattern(trie) + r"\b", re.IGNORECASE)
+
+def _trie_pattern(node: Dict) -> str:
+    """Regex for a character trie with shared prefixes factored out.
+
+    A position is tested against one branch per leading character instead of every term.
+    Longer terms are tried first, and spaces in multi-word terms match any run of whitespace.
+    """
+    branches = [(r"\s+" if char == " " else re.escape(char)) + _trie_pattern(child)
+                for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        # pattern is already a group when it has several branches
+        return (pattern if len(branches) > 1 or len(pattern) == 1 else f"(?:{pattern})") + "?"
+    return pattern
+
+def _match_case(original: str, replacement: str) -> str:
+    """Give replacement the casing of the text it replaces (UPPER, Capitalized or as written)."""
+    if original.isupper() and len(original) > 1:
+        return replacement.upper()
+    if original[:1].isupper():
+        return replacement[:1].upper() + replacement[1:]
+    return replacement
+
+def load_term_levels(path: str = None) -> List[Dict[str, str]]:
+    """Read the rewrite tiers from a JSON file ({"levels": [{term: replacement}, ...]} or a bare list).
+
+    Without a path, the tiers in CONFIG["sanitizer_terms"] are used.
+    """
+    path = path or CONFIG["sanitizer_terms_file"]
+    if not path:
+        return CONFIG["sanitizer_terms"]
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("levels", []) if isinstance(data, dict) else data
+
+_sanitizer: Optional[PromptSanitizer] = None
+_sanitizer_source = None
+_sanitizer_lock = threading.Lock()
+
+def get_sanitizer() -> PromptSanitizer:
+    """Process-wide sanitizer, recompiled only when the configured term list changes."""
+    global _sanitizer, _sanitizer_source
+    source = (CONFIG["sanitizer_terms_file"], id(CONFIG["sanitizer_terms"]))
+    with _sanitizer_lock:
+        if _sanitizer is None or _sanitizer_source != source:
+            _sanitizer, _sanitizer_source = PromptSanitizer(load_term_levels()), source
+        return _sanitizer
@@ -0,0 +1,379 @@
+import argparse
+import json
+import mimetypes
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import quote, unquote, urlparse
+from .config import CONFIG
+from .ui import create_agent, save_story_outputs
+from .utils import story_folder_name
+from . import tracing
+
+STYLE_OPTIONS = ["Cinematic", "Documentary", "Anime", "Noir", "Experimental"]
+
+# Story folder files the server may send. JSON is limited to the saved storyboard and its trace,
+# so knowledge bases left in story folders by older versions are never served
+SERVED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".html"}
+SERVED_JSON = re.compile(r"(storyboard_.+|trace)\.json")
+
+class QueueFull(Exception):
+    """Raised when the server already holds CONFIG["server_max_queued"] unfinished jobs."""
+
+class Job:
+    """One storyboard request; scenes are appended as they complete and waiting streams are woken."""
+
+    def __init__(self, plot: str, num_scenes: int, visual_style: str, bypass_cache: bool):
+        self.job_id = uuid.uuid4().hex
+        self.plot = plot
+        self.num_scenes = num_scenes
+        self.visual_style = visual_style
+        self.bypass_cache = bypass_cache
+        self.folder_name = story_folder_name(plot, num_scenes, visual_style)
+        self.status = "queued"
+        self.scenes: List[Dict] = []
+        self.storyboard: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def file_url(self, filename: Optional[str]) -> Optional[str]:
+        return f"/outputs/{quote(self.folder_name)}/{quote(filename)}" if filename else None
+
+    def scene_payload(self, scene: Dict) -> Dict:
+        """A scene with URLs for its image and variants."""
+        payload = dict(scene, image_url=self.file_url(scene.get("image_filename")))
+        if scene.get("image_variants"):
+            payload["image_variant_urls"] = {kind: self.file_url(filename)
+                                             for kind, filename in scene["image_variants"].items()}
+        return payload
+
+    def to_dict(self) -> Dict:
+        with self.changed:
+            job = {
+                "job_id": self.job_id,
+                "status": self.status,
+                "plot": self.plot,
+                "num_scenes": self.num_scenes,
+                "visual_style": self.visual_style,
+                "scenes_completed": len(self.scenes),
+                "events_url": f"/jobs/{self.job_id}/events",
+                "created_at": self.created_at,
+                "finished_at": self.finished_at
+            }
+            if self.error:
+                job["error"] = self.error
+            if self.storyboard is not None:
+                job["storyboard"] = dict(self.storyboard,
+                                         scenes=[self.scene_payload(scene) for scene in self.storyboard["scenes"]])
+                job["mood_chart_url"] = self.file_url("mood_distribution.png")
+                job["page_url"] = self.file_url(CONFIG["storyboard_page"])
+            return job
+
+    def update(self, **changes):
+        with self.changed:
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self.changed.notify_all()
+
+    def add_scene(self, scene: Dict):
+        with self.changed:
+            self.scenes.append(scene)
+            self.changed.notify_all()
+
+class JobManager:
+    """Runs storyboard jobs on a bounded worker pool with one warm, shared StoryboardAgent.
+
+    At most job_concurrency storyboards are generated at once; submissions beyond
+    max_queued unfinished jobs are refused so clients back off instead of piling up work.
+    The agent's own LLM and image limits apply across all jobs.
+    """
+
+    def __init__(self, agent, job_concurrency: int = None, max_queued: int = None, history: int = None):
+        self.agent = agent
+        self.max_queued = max_queued or CONFIG["server_max_queued"]
+        self.history = history or CONFIG["server_job_history"]
+        self.executor = ThreadPoolExecutor(max_workers=job_concurrency or CONFIG["server_job_concurrency"],
+                                           thread_name_prefix="storyboard-job")
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, plot: str, num_scenes: int, visual_style: str, bypass_cache: bool = False) -> Job:
+        job = Job(plot, num_scenes, visual_style, bypass_cache)
+        with self._lock:
+            if self.unfinished() >= self.max_queued:
+                tracing.inc("server_jobs_rejected_total")
+                raise QueueFull(f"{self.max_queued} jobs are already queued or running")
+            self.jobs[job.job_id] = job
+            self._evict()
+        tracing.inc("server_jobs_total")
+        self.executor.submit(tracing.propagate(self._run), job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def unfinished(self) -> int:
+        return sum(not job.finished for job in self.jobs.values())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "failed")}
+
+    def _evict(self):
+        """Forget the oldest finished jobs beyond the history limit; their output folders stay on disk."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job_id]
+
+    def _run(self, job: Job):
+        story_output_dir = os.path.join(CONFIG["output_dir"], job.folder_name)
+        job.update(status="running")
+        try:
+            os.makedirs(story_output_dir, exist_ok=True)
+            scene_stream = self.agent.stream_storyboard(job.plot, job.num_scenes, job.visual_style,
+                                                        output_dir=story_output_dir, bypass_cache=job.bypass_cache)
+            while True:
+                try:
+                    job.add_scene(next(scene_stream))
+                except StopIteration as stop:
+                    storyboard = stop.value
+                    break
+            if not storyboard:
+                raise ValueError("Storyboard generation failed.")
+            if not save_story_outputs(self.agent, storyboard, story_output_dir, job.folder_name):
+                raise ValueError(f"Failed to save storyboard to {story_output_dir}")
+            job.update(status="done", storyboard=storyboard, finished_at=time.time())
+            tracing.inc("server_jobs_finished_total", status="done")
+        except Exception as e:
+            print(f"❌ Job {job.job_id} failed: {str(e)}")
+            job.update(status="failed", error=str(e), finished_at=time.time())
+            tracing.inc("server_jobs_finished_total", status="failed")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def parse_job_request(body: Dict) -> Dict:
+    """Validate a job submission the same way the console UI does; raises ValueError with the reason."""
+    plot = str(body.get("plot") or "").strip()
+    if not plot:
+        raise ValueError("Plot cannot be empty.")
+    try:
+        num_scenes = int(body.get("num_scenes", 3))
+    except (TypeError, ValueError):
+        raise ValueError("num_scenes must be a number.")
+    if not 1 <= num_scenes <= CONFIG["max_scenes"]:
+        raise ValueError(f"Number of scenes must be between 1 and {CONFIG['max_scenes']}.")
+    visual_style = str(body.get("visual_style") or "Cinematic").strip().capitalize()
+    if visual_style not in STYLE_OPTIONS:
+        raise ValueError(f"visual_style must be one of {STYLE_OPTIONS}.")
+    return {"plot": plot, "num_scenes": num_scenes, "visual_style": visual_style,
+            "bypass_cache": bool(body.get("bypass_cache", False))}
+
+def output_file_path(folder: str, filename: str) -> Optional[str]:
+    """Path of a servable file inside a story folder of CONFIG["output_dir"], or None."""
+    if not folder or not filename or any(part.startswith(".") or "/" in part or "\\" in part
+                                        for part in (folder, filename)):
+        return None
+    if os.path.splitext(filename)[1].lower() not in SERVED_EXTENSIONS and not SERVED_JSON.fullmatch(filename):
+        return None
+    root = os.path.realpath(CONFIG["output_dir"])
+    path = os.path.realpath(os.path.join(root, folder, filename))
+    if os.path.dirname(os.path.dirname(path)) != root or not os.path.isfile(path):
+        return None
+    return path
+
+class StoryboardServer(ThreadingHTTPServer):
+    """HTTP front end for a JobManager; requests beyond max_connections are answered with 503."""
+
+    daemon_threads = True
+
+    def __init__(self, address, manager: JobManager, max_connections: int = None):
+        super().__init__(address, StoryboardRequestHandler)
+        self.manager = manager
+        self.connection_slots = threading.BoundedSemaphore(max_connections or CONFIG["server_max_connections"])
+
+class StoryboardRequestHandler(BaseHTTPRequestHandler):
+    """JSON API:
+
+    POST /jobs                       submit {plot, num_scenes, visual_style, bypass_cache}; 202 with the job ID
+    GET  /jobs/<id>                  job status, and the storyboard once done
+    GET  /jobs/<id>/events           Server-Sent Events: one "scene" event per scene, then "done" or "error"
+    GET  /outputs/<folder>/<file>    scene images, variants, mood_distribution.png and the HTML page
+    GET  /health, GET /metrics       job counts; Prometheus metrics when tracing is enabled
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "StoryboardWeaver"
+
+    def log_message(self, format, *args):
+        if CONFIG["server_access_log"]:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: Dict, headers: Dict = None):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, headers: Dict = None):
+        self._send_json(status, {"error": message}, headers)
+
+    def _limited(self, handler):
+        if not self.server.connection_slots.acquire(blocking=False):
+            tracing.inc("server_requests_rejected_total")
+            self._error(503, "Too many open requests, retry later", {"Retry-After": "1"})
+            return
+        try:
+            handler(urlparse(self.path).path)
+        finally:
+            self.server.connection_slots.release()
+
+    def do_POST(self):
+        self._limited(self._post)
+
+    def do_GET(self):
+        self._limited(self._get)
+
+    def _post(self, path: str):
+        if path.rstrip("/") != "/jobs":
+            return self._error(404, "Not found")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            job = self.server.manager.submit(**parse_job_request(body if isinstance(body, dict) else {}))
+        except ValueError as e:
+            return self._error(400, str(e))
+        except QueueFull as e:
+            return self._error(429, str(e), {"Retry-After": str(CONFIG["server_retry_after"])})
+        self._send_json(202, job.to_dict(), {"Location": f"/jobs/{job.job_id}"})
+
+    def _get(self, path: str):
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+        if parts == ["health"]:
+            return self._send_json(200, {"status": "ok", "jobs": self.server.manager.stats()})
+        if parts == ["metrics"]:
+            return self._send_text(200, tracing.METRICS.prometheus_text(), "text/plain; version=0.0.4")
+        if len(parts) == 3 and parts[0] == "outputs":
+            return self._send_file(output_file_path(parts[1], parts[2]))
+        if parts[0] == "jobs" and len(parts) in (2, 3):
+            job = self.server.manager.get(parts[1])
+            if job is None:
+                return self._error(404, f"Unknown job {parts[1]}")
+            if len(parts) == 2:
+                return self._send_json(200, job.to_dict())
+            if parts[2] == "events":
+                return self._stream_events(job)
+        self._error(404, "Not found")
+
+    def _send_text(self, status: int, text: str, content_type: str):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, path: Optional[str]):
+        if path is None:
+            return self._error(404, "File not found")
+        self.send_response(200)
+        self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Cache-Control", "max-age=3600")
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def _event(self, event: str, data: Dict):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _stream_events(self, job: Job):
+        """Send every scene of job as it completes, replaying those already done, then the outcome."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        sent = 0
+        try:
+            while True:
+                with job.changed:
+                    if sent == len(job.scenes) and not job.finished:
+                        job.changed.wait(CONFIG["server_keepalive"])
+                    scenes, finished = job.scenes[sent:], job.finished
+                for scene in scenes:
+                    self._event("scene", job.scene_payload(scene))
+                sent += len(scenes)
+                if finished:
+                    if job.status == "done":
+                        self._event("done", job.to_dict())
+                    else:
+                        self._event("error", {"job_id": job.job_id, "error": job.error})
+                    return
+                if not scenes:
+                    # Comment line, so proxies and clients keep an idle stream open
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client went away; the job keeps running
+
+def _warm_up(agent):
+    if agent.embedding_model is not None:
+        agent.embedding_model.encode("warm-up")
+
+def serve(host: str = None, port: int = None, job_concurrency: int = None, max_queued: int = None,
+          llm_concurrency: int = None, image_concurrency: int = None, warm: bool = True):
+    """Run the storyboard HTTP service until interrupted."""
+    agent = create_agent(os.path.join(CONFIG["output_dir"], CONFIG["knowledge_base"]),
+                         llm_concurrency=llm_concurrency, image_concurrency=image_concurrency)
+    if warm:
+        # Load the embedding model once up front so the first job does not pay for it
+        threading.Thread(target=_warm_up, args=(agent,), daemon=True).start()
+    manager = JobManager(agent, job_concurrency, max_queued)
+    server = StoryboardServer((host or CONFIG["server_host"], port or CONFIG["server_port"]), manager)
+    print(f"🎬 Storyboard server listening on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        manager.shutdown()
+        tracing.write_metrics()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve storyboard generation over HTTP/JSON with streamed scenes.")
+    parser.add_argument("--host", help="Interface to bind (default: CONFIG['server_host'])")
+    parser.add_argument("--port", type=int, help="Port to listen on (default: CONFIG['server_port'])")
+    parser.add_argument("--job-concurrency", type=int, help="Storyboards generated at once")
+    parser.add_argument("--max-queued", type=int, help="Unfinished jobs accepted before answering 429")
+    parser.add_argument("--llm-concurrency", type=int, help="Maximum in-flight LLM calls")
+    parser.add_argument("--image-concurrency", type=int, help="Maximum in-flight image calls")
+    parser.add_argument("--no-warm", action="store_true", help="Load the embedding model on the first job instead")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.job_concurrency, args.max_queued, args.llm_concurrency, args.image_concurrency,
+          warm=not args.no_warm)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from .config import CONFIG
+from .knowledge_base import KnowledgeBase
+from .vector_index import VectorIndex
+
+def shard_value(value: Optional[str]) -> str:
+    """Lowercase, filesystem-safe form of a genre or visual style used in shard paths."""
+    return re.sub(r"[^a-z0-9]+", "-", (value or "").lower()).strip("-") or "unspecified"
+
+class ShardedKnowledgeBase:
+    """One knowledge base shared by every story, partitioned into shards by genre and visual style.
+
+    Each shard is a KnowledgeBase with its own VectorIndex stored under
+    <base>_shards/<genre>/<visual_style>.jsonl. Searches can target one shard or fan out
+    over every matching shard in parallel. With no shard fields the knowledge base at
+    knowledge_base_path is used unpartitioned.
+    """
+
+    def __init__(self, knowledge_base_path: str, genre_of: Callable[[str], str], shard_by: List[str] = None):
+        self.knowledge_base_path = knowledge_base_path
+        self.genre_of = genre_of
+        self.shard_by = list(CONFIG["kb_shard_by"] if shard_by is None else shard_by)
+        self.root = f"{os.path.splitext(knowledge_base_path)[0]}_shards"
+        self._shards: Dict[Tuple[str, ...], VectorIndex] = {}
+        self._lock = threading.Lock()
+        if self.shard_by:
+            self._migrate_unsharded()
+        self.refresh()
+
+    def shard_key(self, plot: str, visual_style: Optional[str]) -> Tuple[str, ...]:
+        fields = {"genre": self.genre_of(plot), "visual_style": visual_style}
+        return tuple(shard_value(fields[field]) for field in self.shard_by)
+
+    def _shard_path(self, key: Tuple[str, ...]) -> str:
+        if not key:
+            return self.knowledge_base_path
+        return os.path.join(self.root, *key[:-1], f"{key[-1]}.json")
+
+    def shard(self, key: Tuple[str, ...]) -> VectorIndex:
+        """Return the index of the shard for key, opening (or creating) it on first use."""
+        with self._lock:
+            if key not in self._shards:
+                self._shards[key] = VectorIndex(KnowledgeBase(self._shard_path(key)))
+            return self._shards[key]
+
+    def shard_paths(self) -> List[str]:
+        """Knowledge base paths of every shard on disk."""
+        self._discover()
+        with self._lock:
+            return [self._shard_path(key) for key in sorted(self._shards)]
+
+    def _discover(self):
+        """Open shards created on disk by other agents or processes."""
+        if not self.shard_by:
+            self.shard(())
+            return
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".jsonl"):
+                    relative = os.path.relpath(os.path.join(dirpath, filename[:-len(".jsonl")]), self.root)
+                    key = tuple(relative.split(os.sep))
+                    if len(key) == len(self.shard_by):
+                        self.shard(key)
+
+    def _migrate_unsharded(self):
+        """One-shot split of an existing unpartitioned knowledge base into shards, keeping its embeddings."""
+        if not (os.path.exists(self.knowledge_base_path)
+                or os.path.exists(f"{os.path.splitext(self.knowledge_base_path)[0]}.jsonl")):
+            return
+        base = KnowledgeBase(self.knowledge_base_path)
+        with base.lock():
+            records, _ = base.read_records()
+            if not records:
+                return
+            dims = {r["embedding_dim"] for r in records if r.get("embedding_row") is not None}
+            rows = 1 + max((r["embedding_row"] for r in records if r.get("embedding_row") is not None), default=-1)
+            embeddings = base.load_embeddings(dims.pop(), rows) if len(dims) == 1 else None
+            groups: Dict[Tuple[str, ...], List] = {}
+            for record in records:
+                row = record.get("embedding_row")
+                embedding = np.array(embeddings[row]) if embeddings is not None and row is not None else None
+                stripped = {k: v for k, v in record.items() if not k.startswith("embedding_")}
+                key = self.shard_key(record["plot"], record.get("visual_style"))
+                groups.setdefault(key, []).append((stripped, embedding))
+            for path in (base.records_path, base.embeddings_path):
+                os.replace(path, f"{path}.migrated")
+        for key, entries in groups.items():
+            self.shard(key).knowledge_base.append_many(entries)
+        print(f"Migrated {len(records)} plots from {base.records_path} into {len(groups)} shards under {self.root}")
+
+    def append(self, plot: str, storyboard: Dict, embedding=None, **extra) -> Dict:
+        """Append a plot record to the shard of its genre and visual style."""
+        index = self.shard(self.shard_key(plot, extra.get("visual_style")))
+        record = index.knowledge_base.append(plot, storyboard, embedding, **extra)
+        index.refresh()
+        return record
+
+    def append_many(self, entries: List[Tuple[Dict, Optional[np.ndarray]]]):
+        """Append (record, embedding) pairs, grouped into one write per shard."""
+        groups: Dict[Tuple[str, ...], List] = {}
+        for record, embedding in entries:
+            groups.setdefault(self.shard_key(record["plot"], record.get("visual_style")), []).append((record, embedding))
+        for key, group in groups.items():
+            self.shard(key).knowledge_base.append_many(group)
+
+    def refresh(self):
+        """Pick up new shards and records appended to existing ones."""
+        self._discover()
+        with self._lock:
+            indexes = list(self._shards.values())
+        for index in indexes:
+            index.refresh()
+
+    def _matching(self, plot: Optional[str], visual_style: Optional[str], scope: str) -> List[VectorIndex]:
+        """Indexes of the shards a query should search: its own shard, its genre's shards, or all."""
+        with self._lock:
+            shards = dict(self._shards)
+        if scope == "all" or plot is None:
+            return list(shards.values())
+        key = self.shard_key(plot, visual_style)
+        fields = self.shard_by if scope == "shard" else [f for f in self.shard_by if f == "genre"]
+        wanted = {i: key[i] for i, field in enumerate(self.shard_by) if field in fields}
+        return [index for shard_key, index in shards.items() if all(shard_key[i] == v for i, v in wanted.items())]
+
+    def search(self, query_embedding, top_k: int = 3, threshold: float = -1.0, plot: str = None,
+               visual_style: str = None, scope: str = "all") -> List[Tuple[Dict, float]]:
+        """Search the shards selected by scope ("shard", "genre" or "all") and merge the best matches.
+
+        Several shards are searched in parallel; numpy releases the GIL for the similarity products.
+        """
+        indexes = [index for index in self._matching(plot, visual_style, scope) if len(index)]
+        if len(indexes) == 1:
+            return indexes[0].search(query_embedding, top_k, threshold)
+        matches = [match for result in _search_pool().map(
+            lambda index: index.search(query_embedding, top_k, threshold), indexes) for match in result]
+        return sorted(matches, key=lambda match: -match[1])[:top_k]
+
+    def size(self, plot: str = None, visual_style: str = None, scope: str = "all") -> int:
+        """Number of indexed plots in the shards a query with this scope would search."""
+        return sum(len(index) for index in self._matching(plot, visual_style, scope))
+
+    def __len__(self) -> int:
+        return self.size()
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _search_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=CONFIG["kb_search_workers"] or os.cpu_count(),
+                                       thread_name_prefix="kb-search")
+        return _pool
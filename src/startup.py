@@ -0,0 +1,53 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+
+# Modules that should only be imported once the stage that needs them runs
+HEAVY_MODULES = ["sentence_transformers", "transformers", "torch", "sklearn", "bs4", "azure.ai.inference",
+                 "openai", "PIL", "IPython", "matplotlib"]
+
+def _import_time(module: str) -> Dict:
+    """Time importing a module in a fresh interpreter and list the heavy modules it pulled in."""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(elapsed, *[m for m in {HEAVY_MODULES!r} if m in sys.modules])\n"
+    )
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=project_root, capture_output=True,
+                            text=True, check=True).stdout.split()
+    return {"seconds": float(output[0]), "heavy_modules": output[1:]}
+
+def startup_report(load_model: bool = False) -> Dict:
+    """Measure import, agent construction and (optionally) first-encode times."""
+    report = {"import src.agent": _import_time("src.agent"), "import src.ui": _import_time("src.ui")}
+    from .agent import StoryboardAgent
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        agent = StoryboardAgent(endpoint="http://localhost", api_key="unused", model_name="unused",
+                                knowledge_base_path=os.path.join(tmp_dir, "knowledge_base.json"))
+        report["construct StoryboardAgent"] = {"seconds": time.perf_counter() - start}
+        if load_model:
+            start = time.perf_counter()
+            if agent.embedding_model is not None:
+                agent.embedding_model.encode("warm-up")
+            report["first encode"] = {"seconds": time.perf_counter() - start}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Report Storyboard Weaver startup timings.")
+    parser.add_argument("--load-model", action="store_true", help="Also time loading the embedding model")
+    args = parser.parse_args()
+    for stage, result in startup_report(args.load_model).items():
+        heavy = result.get("heavy_modules")
+        suffix = f" (heavy modules loaded: {', '.join(heavy) or 'none'})" if heavy is not None else ""
+        print(f"⏱️ {stage}: {result['seconds'] * 1000:.1f} ms{suffix}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from .config import CONFIG
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_trace = contextvars.ContextVar("storyboard_trace", default=None)
+_current_span = contextvars.ContextVar("storyboard_span", default=None)
+_span_ids = itertools.count(1)
+
+class _NoopSpan:
+    """Returned by span() when tracing is disabled, so instrumented code pays almost nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class Span:
+    """A timed pipeline stage with attributes, recorded into the current storyboard trace."""
+
+    def __init__(self, name: str, attributes: Dict):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(_span_ids)
+        self.parent_id = None
+        self._token = None
+
+    def set(self, **attributes):
+        """Attach attributes (retry counts, cache hits, bytes written, ...) to the span."""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent else None
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.attributes["error"] = repr(exc)
+        METRICS.observe("stage_duration_seconds", duration, stage=self.name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(self, duration)
+        return False
+
+class StoryboardTrace:
+    """All spans recorded while generating one storyboard."""
+
+    def __init__(self, name: str, attributes: Dict):
+        self.name = name
+        self.attributes = attributes
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span, duration: float):
+        with self._lock:
+            self.spans.append({
+                "id": span.span_id,
+                "parent_id": span.parent_id,
+                "name": span.name,
+                "start_ms": round((span.start - self._origin) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+                "thread": threading.current_thread().name,
+                "attributes": span.attributes
+            })
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {"name": self.name, "started_at": self.started_at, "attributes": self.attributes, "spans": spans}
+
+    def export(self, path: str):
+        """Write the trace as JSON."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+class Metrics:
+    """Process-wide Prometheus-style counters and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[tuple, float] = {}
+        self.histograms: Dict[tuple, Dict] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict) -> tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not CONFIG["tracing"]:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        if not CONFIG["tracing"]:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.setdefault(key, {"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    @staticmethod
+    def _labels(labels: tuple, extra: str = "") -> str:
+        parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def prometheus_text(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: {**h, "buckets": list(h["buckets"])} for key, h in self.histograms.items()}
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE storyboard_{name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"storyboard_{name}{self._labels(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE storyboard_{name} histogram")
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                buckets = list(zip(DURATION_BUCKETS, histogram["buckets"])) + [("+Inf", histogram["count"])]
+                for bound, count in buckets:
+                    bucket_labels = self._labels(labels, 'le="%s"' % bound)
+                    lines.append(f"storyboard_{name}_bucket{bucket_labels} {count}")
+                lines.append(f"storyboard_{name}_sum{self._labels(labels)} {histogram['sum']}")
+                lines.append(f"storyboard_{name}_count{self._labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.prometheus_text())
+
+METRICS = Metrics()
+
+def span(name: str, **attributes):
+    """Time a pipeline stage; a shared no-op when CONFIG["tracing"] is off."""
+    if not CONFIG["tracing"]:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+def inc(name: str, value: float = 1, **labels):
+    """Increment a process-wide counter."""
+    METRICS.inc(name, value, **labels)
+
+def count(attribute: str, value: float = 1):
+    """Add value to a numeric attribute (e.g. retries) of the innermost open span."""
+    current = _current_span.get() if CONFIG["tracing"] else None
+    if current is not None:
+        current.attributes[attribute] = current.attributes.get(attribute, 0) + value
+
+@contextmanager
+def trace(name: str, export_dir: Optional[str] = None, **attributes):
+    """Collect every span recorded inside the block into one storyboard trace.
+
+    The trace is written to <export_dir>/trace.json when export_dir is given.
+    """
+    if not CONFIG["tracing"]:
+        yield None
+        return
+    storyboard_trace = StoryboardTrace(name, attributes)
+    token = _current_trace.set(storyboard_trace)
+    try:
+        with span(name, **attributes):
+            yield storyboard_trace
+    finally:
+        _current_trace.reset(token)
+        if export_dir:
+            storyboard_trace.export(os.path.join(export_dir, "trace.json"))
+
+def write_metrics(path: Optional[str] = None):
+    """Write the process-wide metrics to CONFIG["metrics_path"] when tracing is enabled."""
+    if CONFIG["tracing"]:
+        METRICS.write_prometheus(path or CONFIG["metrics_path"])
+
+def propagate(fn: Callable) -> Callable:
+    """Bind fn to the caller's trace context so spans recorded in worker threads join its trace."""
+    if not CONFIG["tracing"]:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Iterable, Optional, TypeVar
+import requests
+from requests.adapters import HTTPAdapter
+from .config import CONFIG
+from . import tracing
+
+T = TypeVar("T")
+
+# Throttling and transient server errors are retried; other HTTP errors are not
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """Return the process-wide pooled HTTP session."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=CONFIG["http_pool_size"], pool_maxsize=CONFIG["http_pool_size"])
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+def status_code_of(error: Exception) -> Optional[int]:
+    """Extract the HTTP status code from a requests, httpx, openai or azure-core error."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read a Retry-After (or retry-after-ms) header from an error's response, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error: Exception) -> bool:
+    """Retry throttling, transient server errors and errors with no HTTP status (network failures)."""
+    status = status_code_of(error)
+    return status is None or status in RETRYABLE_STATUS
+
+def backoff_delay(attempt: int, error: Exception = None) -> Optional[float]:
+    """Exponential backoff with full jitter, never shorter than the server's Retry-After.
+
+    Returns None when Retry-After exceeds CONFIG["retry_after_max"], meaning the call should not be retried.
+    """
+    delay = random.uniform(0, min(CONFIG["backoff_max"], CONFIG["backoff_base"] * 2 ** attempt))
+    retry_after = retry_after_seconds(error) if error is not None else None
+    if retry_after is not None:
+        if retry_after > CONFIG["retry_after_max"]:
+            return None
+        delay = max(delay, retry_after)
+    return delay
+
+def call_with_retries(fn: Callable[[], T], max_attempts: int = None) -> T:
+    """Call fn, retrying retryable errors with backoff; the last error is re-raised."""
+    max_attempts = max_attempts or CONFIG["http_max_retries"]
+    for attempt in range(max_attempts):
+        try:
+            return fn()
+        except Exception as e:
+            delay = backoff_delay(attempt, e) if attempt < max_attempts - 1 and is_retryable(e) else None
+            if delay is None:
+                raise
+            tracing.inc("http_retries_total", status=status_code_of(e) or "network")
+            tracing.count("retries")
+            time.sleep(delay)
+
+async def acall_with_retries(fn: Callable[[], Awaitable[T]], max_attempts: int = None) -> T:
+    """Async variant of call_with_retries; fn must return a new awaitable on each call."""
+    max_attempts = max_attempts or CONFIG["http_max_retries"]
+    for attempt in range(max_attempts):
+        try:
+            return await fn()
+        except Exception as e:
+            delay = backoff_delay(attempt, e) if attempt < max_attempts - 1 and is_retryable(e) else None
+            if delay is None:
+                raise
+            tracing.inc("http_retries_total", status=status_code_of(e) or "network")
+            tracing.count("retries")
+            await asyncio.sleep(delay)
+
+# Downloads are streamed to disk in chunks of this size instead of buffered in memory
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def download_file(url: str, path: str):
+    """Stream url to path using the pooled session."""
+    with get_session().get(url, timeout=CONFIG["http_timeout"], stream=True) as response:
+        response.raise_for_status()
+        _write_chunks(path, response.iter_content(DOWNLOAD_CHUNK_SIZE))
+
+async def adownload_file(client, url: str, path: str):
+    """Stream url to path with an httpx.AsyncClient."""
+    tmp_path = _part_path(path)
+    size = 0
+    try:
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+        _finish_write(tmp_path, path, size)
+    finally:
+        _discard(tmp_path)
+
+def _write_chunks(path: str, chunks: Iterable[bytes]):
+    """Write chunks to path atomically, so hard-linked cache entries are never modified in place."""
+    tmp_path = _part_path(path)
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        _finish_write(tmp_path, path, size)
+    finally:
+        _discard(tmp_path)
+
+def _part_path(path: str) -> str:
+    """Temporary sibling of path that no other writer (thread, task or process) of the same file shares."""
+    return f"{path}.{uuid.uuid4().hex}.part"
+
+def _discard(tmp_path: str):
+    """Remove a temporary file left behind by a failed write."""
+    try:
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
+
+def _finish_write(tmp_path: str, path: str, size: int):
+    os.replace(tmp_path, path)
+    tracing.inc("bytes_written_total", size, kind="image")
+    tracing.count("bytes", size)
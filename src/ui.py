@@ -1,8 +1,9 @@
 import os
 from .agent import StoryboardAgent
-from .visualization import display_storyboard, visualize_mood
+from .visualization import display_storyboard, display_storyboard_stream, visualize_mood, write_storyboard_page
 from .config import CONFIG
-from .utils import sanitize_filename
+from .utils import story_folder_name
+from . import tracing
 
 def create_ui():
     """Create a console-based UI for the Storyboard Weaver."""
@@ -42,43 +43,62 @@ def create_ui():
     print(f"Selected style: {style}")
     
     # Create story-specific output folder
-    story_folder_name = sanitize_filename(plot)
-    story_output_dir = os.path.join(CONFIG["output_dir"], story_folder_name)
+    folder_name = story_folder_name(plot, num_scenes, style)
+    story_output_dir = os.path.join(CONFIG["output_dir"], folder_name)
     print(f"Creating output directory: {story_output_dir}")
     os.makedirs(story_output_dir, exist_ok=True)
     
-    # Set knowledge base path for this story
-    knowledge_base_path = os.path.join(story_output_dir, CONFIG["knowledge_base"])
-    
-    # Initialize agent with story-specific knowledge base
-    agent = StoryboardAgent(
-        endpoint=os.environ["LLM_MODEL_ENDPOINT"],
-        api_key=os.environ["LLM_MODEL_API_KEY"],
-        model_name=os.environ["LLM_MODEL_NAME"],
-        knowledge_base_path=knowledge_base_path
-    )
+    # Initialize agent with the knowledge base shared by all stories
+    agent = create_agent(os.path.join(CONFIG["output_dir"], CONFIG["knowledge_base"]))
     
     # Generate and display storyboard
     try:
         print("\n🔍 Analyzing your plot...")
-        storyboard = agent.execute_function("generate_storyboard", plot=plot, num_scenes=num_scenes, visual_style=style)
-        if not storyboard:
-            raise ValueError("Storyboard generation failed.")
-        
-        print("📊 Analyzing story structure...")
-        mood_analysis = agent.execute_function("analyze_mood", storyboard=storyboard)
-        
-        print(f"\n🎬 {storyboard.get('title', 'Your Storyboard')}")
-        display_storyboard(storyboard, story_output_dir)
-        visualize_mood(mood_analysis, story_output_dir)
-        
-        # Save storyboard in story-specific folder
-        filename = os.path.join(story_output_dir, f"storyboard_{story_folder_name}.json")
-        print(f"Attempting to save storyboard to: {filename}")
-        if agent.execute_function("save_storyboard", storyboard=storyboard, filename=filename):
+        if CONFIG["stream_scenes"]:
+            # Render each scene as soon as it and its image are ready
+            storyboard = display_storyboard_stream(
+                agent.stream_storyboard(plot, num_scenes, style, output_dir=story_output_dir), story_output_dir)
+            if not storyboard:
+                raise ValueError("Storyboard generation failed.")
+            print(f"\n🎬 {storyboard.get('title', 'Your Storyboard')}")
+        else:
+            storyboard = agent.execute_function("generate_storyboard", plot=plot, num_scenes=num_scenes, visual_style=style,
+                                                output_dir=story_output_dir)
+            if not storyboard:
+                raise ValueError("Storyboard generation failed.")
+            
+            print(f"\n🎬 {storyboard.get('title', 'Your Storyboard')}")
+            display_storyboard(storyboard, story_output_dir)
+        filename = save_story_outputs(agent, storyboard, story_output_dir, folder_name)
+        if filename:
             print(f"💾 Storyboard saved to {filename}")
         else:
-            print(f"❌ Failed to save storyboard to {filename}")
+            print(f"❌ Failed to save storyboard to {story_output_dir}")
     except Exception as e:
         print(f"❌ Error: {str(e)}")
-        print("Please try again with different parameters.")
\ No newline at end of file
+        print("Please try again with different parameters.")
+    tracing.write_metrics()
+
+def create_agent(knowledge_base_path: str, **kwargs) -> StoryboardAgent:
+    """Create a StoryboardAgent using the API credentials from the environment."""
+    return StoryboardAgent(
+        endpoint=os.environ["LLM_MODEL_ENDPOINT"],
+        api_key=os.environ["LLM_MODEL_API_KEY"],
+        model_name=os.environ["LLM_MODEL_NAME"],
+        knowledge_base_path=knowledge_base_path,
+        **kwargs
+    )
+
+def save_story_outputs(agent: StoryboardAgent, storyboard: dict, story_output_dir: str, story_folder_name: str) -> str:
+    """Write the mood chart, storyboard JSON and HTML page into the story folder; returns the JSON path or None."""
+    print("📊 Analyzing story structure...")
+    mood_analysis = agent.execute_function("analyze_mood", storyboard=storyboard)
+    visualize_mood(mood_analysis, story_output_dir)
+    
+    # Save storyboard in story-specific folder
+    filename = os.path.join(story_output_dir, f"storyboard_{story_folder_name}.json")
+    print(f"Attempting to save storyboard to: {filename}")
+    if agent.execute_function("save_storyboard", storyboard=storyboard, filename=filename):
+        write_storyboard_page(storyboard, story_output_dir)
+        return filename
+    return None
@@ -1,8 +1,10 @@
+import hashlib
 import json
-import os
-from pathlib import Path
 import re
+import sys
 from .config import CONFIG
+from . import tracing
+from .sharded_kb import ShardedKnowledgeBase
 
 def sanitize_filename(name: str, max_length: int = 20) -> str:
     """Sanitize a string to be a valid folder name."""
@@ -17,9 +19,57 @@ def sanitize_filename(name: str, max_length: int = 20) -> str:
     # If empty, use default name
     return name if name else "unnamed_story"
 
-def init_knowledge_base(knowledge_base_path: str):
-    """Initialize the knowledge base file in the specified path if it doesn't exist."""
-    os.makedirs(os.path.dirname(knowledge_base_path), exist_ok=True)
-    if not Path(knowledge_base_path).exists():
-        with open(knowledge_base_path, "w") as f:
-            json.dump({"plots": []}, f)
\ No newline at end of file
+def wikipedia_intro(html: str, max_chars: int) -> str:
+    """Text of the first three paragraphs of a Wikipedia article page, truncated to max_chars."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    content = soup.find('div', {'id': 'mw-content-text'})
+    paragraphs = content.find_all('p')[:3] if content else []
+    return " ".join([p.get_text().strip() for p in paragraphs if p.get_text().strip()])[:max_chars]
+
+def story_id(plot: str, num_scenes: int, visual_style: str) -> str:
+    """Stable ID of a (plot, num_scenes, visual_style) request."""
+    key = json.dumps([plot, num_scenes, visual_style])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+def story_folder_name(plot: str, num_scenes: int, visual_style: str) -> str:
+    """Readable, collision-free folder name: the sanitized plot prefix plus the story ID."""
+    return f"{sanitize_filename(plot)}_{story_id(plot, num_scenes, visual_style)}"
+
+def detect_genre(plot: str) -> str:
+    """Detect film genre from plot keywords."""
+    plot_lower = plot.lower()
+    genre_map = [
+        (["heist", "robbery", "steal"], "heist"),
+        (["sci-fi", "futuristic", "space", "alien"], "sci-fi"),
+        (["romance", "love", "relationship"], "romance"),
+        (["thriller", "suspense", "mystery"], "thriller")
+    ]
+    for keywords, genre in genre_map:
+        if any(word in plot_lower for word in keywords):
+            return genre
+    return CONFIG["default_genre"]
+
+def init_knowledge_base(knowledge_base_path: str) -> ShardedKnowledgeBase:
+    """Open the shared knowledge base at the specified path, creating or migrating it if needed."""
+    with tracing.span("kb_open"):
+        return ShardedKnowledgeBase(knowledge_base_path, detect_genre)
+
+def notebook_backend() -> bool:
+    """True when output should go through IPython display (CONFIG["render_backend"] is "notebook",
+    or "auto" inside a running IPython kernel)."""
+    backend = CONFIG["render_backend"]
+    if backend == "auto":
+        # IPython is only in sys.modules when we were started from it, so this never imports it
+        ipython = sys.modules.get("IPython")
+        shell = ipython.get_ipython() if ipython is not None else None
+        return shell is not None and "IPKernelApp" in getattr(shell, "config", {})
+    return backend == "notebook"
+
+def display_markdown(text: str):
+    """Display Markdown through IPython in a notebook, or print it with the headless backend."""
+    if not notebook_backend():
+        print(text)
+        return
+    from IPython.display import display, Markdown
+    display(Markdown(text))
@@ -0,0 +1,152 @@
+import functools
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .config import CONFIG
+from . import cpu_pool
+from .knowledge_base import KnowledgeBase, normalize_embedding, read_record
+
+# Record fields kept in memory per plot; the storyboard is read from the records file on demand
+INDEXED_FIELDS = ("plot", "visual_style", "output_dir")
+# Records parsed at a time while loading, so a large shard never holds all its storyboards at once
+LOAD_CHUNK_RECORDS = 4096
+
+class VectorIndex:
+    """Memory-mapped index over a knowledge base's normalized float32 embedding sidecar.
+
+    Slim plot metadata (INDEXED_FIELDS, plus where the full record sits in the records file)
+    is kept in memory, aligned with the embedding rows; `load_record` reads the rest. `refresh` picks up
+    records appended since the last read, including ones written by other processes. Rows
+    without a record (left by a writer that crashed between its two writes) stay as gaps
+    that searches skip.
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase):
+        self.knowledge_base = knowledge_base
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.metadata: List[Optional[Dict]] = []
+        self.dim = 0
+        self._gaps = 0
+        self._offset = 0
+        self._file_id = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Load records appended since the last refresh and remap the embedding matrix.
+
+        A re-index replaces the records and sidecar files one after the other under the writer
+        lock. When either file's identity changes, the index is rebuilt while holding that lock,
+        so records are never paired with the wrong sidecar.
+        """
+        with self._lock:
+            if self._load(self.knowledge_base.file_id()):
+                return
+            with self.knowledge_base.lock():
+                if not self._load(self.knowledge_base.file_id(), locked=True):
+                    # Keep serving the previous index; the next refresh reads the files from scratch
+                    self._file_id = None
+
+    def _load(self, file_id, locked: bool = False) -> bool:
+        """Index the records added since the last load; False if the files must be read under the writer lock."""
+        if file_id != self._file_id and not locked:
+            return False
+        if file_id != self._file_id:
+            # The knowledge base was rebuilt (e.g. re-indexed with a new model), so start over
+            metadata, dim, offset, gaps = [], 0, 0, 0
+        else:
+            metadata, dim, offset, gaps = self.metadata, self.dim, self._offset, self._gaps
+        records_path = self.knowledge_base.records_path
+        added, skipped, new_gaps, rows = [], 0, 0, len(metadata)
+        while True:
+            entries, offset = self.knowledge_base.read_entries(offset, max_records=LOAD_CHUNK_RECORDS)
+            if not entries:
+                break
+            indexed = [(line, r) for line, r in entries if r.get("embedding_row") is not None]
+            dim = dim or (indexed[0][1]["embedding_dim"] if indexed else 0)
+            for line, record in sorted(indexed, key=lambda entry: entry[1]["embedding_row"]):
+                row = record["embedding_row"]
+                if record["embedding_dim"] != dim or row < rows:
+                    skipped += 1
+                    continue
+                if row > rows:
+                    new_gaps += row - rows
+                    added.extend([None] * (row - rows))
+                added.append({**{k: record.get(k) for k in INDEXED_FIELDS},
+                              "records_path": records_path, "record_offset": line})
+                rows = row + 1
+        try:
+            embeddings = self.knowledge_base.load_embeddings(dim, rows) if added or file_id != self._file_id else None
+        except ValueError:
+            # The sidecar is shorter than its records: a re-index is swapping them, or the sidecar was cut short
+            if locked:
+                print(f"⚠️ {self.knowledge_base.embeddings_path} is shorter than the records in "
+                      f"{self.knowledge_base.records_path}; keeping the previous index")
+            return False
+        if not locked and self.knowledge_base.file_id() != file_id:
+            return False
+        if file_id != self._file_id:
+            self.metadata, self._file_id = metadata, file_id
+        self.metadata.extend(added)
+        self.dim, self._offset, self._gaps = dim, offset, gaps + new_gaps
+        if embeddings is not None:
+            self.embeddings = embeddings
+        if skipped:
+            print(f"⚠️ Skipped {skipped} records in {self.knowledge_base.records_path} whose embedding "
+                  f"row or dimension does not match the index")
+        if new_gaps:
+            print(f"⚠️ {new_gaps} embedding rows in {self.knowledge_base.embeddings_path} have no "
+                  f"record (interrupted write); they are skipped")
+        return True
+
+    def search(self, query_embedding, top_k: int = 3, threshold: float = -1.0) -> List[Tuple[Dict, float]]:
+        """Return up to top_k (metadata, similarity) pairs above the threshold, best first."""
+        with self._lock:
+            embeddings, metadata, file_id, gaps = self.embeddings, self.metadata, self._file_id, self._gaps
+        if len(metadata) == gaps or top_k <= 0:
+            return []
+        query = normalize_embedding(query_embedding)
+        if query.shape[0] != embeddings.shape[1]:
+            return []
+        matches = None
+        if cpu_pool.enabled() and len(metadata) >= CONFIG["cpu_pool_min_search_rows"]:
+            try:
+                matches = cpu_pool.run(search_mapped, self.knowledge_base.embeddings_path, embeddings.shape[1],
+                                       len(metadata), file_id, query, top_k + gaps, threshold)
+            except (OSError, ValueError):
+                pass  # Sidecar swapped out by a re-index mid-search; answer from this process's mapping
+        if matches is None:
+            matches = top_matches(embeddings, query, top_k + gaps, threshold)
+        return [(metadata[row], score) for row, score in matches if metadata[row] is not None][:top_k]
+
+    def __len__(self) -> int:
+        return len(self.metadata) - self._gaps
+
+def load_record(metadata: Dict) -> Optional[Dict]:
+    """The full stored record (with its storyboard) behind a search result, or None if it was rewritten since."""
+    record = read_record(metadata["records_path"], metadata["record_offset"])
+    if record is None or record.get("plot") != metadata["plot"]:
+        return None
+    return {k: v for k, v in record.items() if not k.startswith("embedding_")}
+
+def top_matches(embeddings: np.ndarray, query: np.ndarray, top_k: int, threshold: float) -> List[Tuple[int, float]]:
+    """(row, similarity) of the top_k rows of a normalized embedding matrix above the threshold, best first."""
+    scores = embeddings @ query
+    k = min(top_k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(int(i), float(scores[i])) for i in top if scores[i] > threshold]
+
+@functools.lru_cache(maxsize=64)
+def _mapped_embeddings(embeddings_path: str, dim: int, rows: int, file_id) -> np.ndarray:
+    return np.memmap(embeddings_path, dtype=np.float32, mode="r", shape=(rows, dim))
+
+def search_mapped(embeddings_path: str, dim: int, rows: int, file_id, query: np.ndarray, top_k: int,
+                  threshold: float) -> List[Tuple[int, float]]:
+    """top_matches over an embedding sidecar, for CPU pool workers.
+
+    Workers memory-map the sidecar read-only (once per file and size) instead of receiving
+    the matrix, so all of them share the same page-cache pages; file_id keys the mapping to
+    the file version the caller searched.
+    """
+    return top_matches(_mapped_embeddings(embeddings_path, dim, rows, file_id), query, top_k, threshold)
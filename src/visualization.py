@@ -1,22 +1,76 @@
-from IPython.display import display, Markdown, Image
-import matplotlib.pyplot as plt
+import functools
+import html
 import os
+import threading
+from .config import CONFIG
+from .utils import notebook_backend, display_markdown
+from . import cpu_pool, tracing
+
+# pyplot's global figure state is not thread-safe
+_pyplot_lock = threading.Lock()
+
+MOOD_COLORS = {
+    "joyful": "#FFD700", "romantic": "#FF69B4", "tense": "#8B0000",
+    "suspenseful": "#4B0082", "dark": "#000000", "hopeful": "#32CD32",
+    "chaotic": "#FF4500"
+}
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; max-width: 960px; margin: 2em auto; color: #222; }}
+.scene {{ border-top: 1px solid #ddd; padding: 1em 0; }}
+.scene img {{ max-width: 100%; }}
+.mood {{ color: #666; font-weight: normal; }}
+</style>
+</head>
+<body>
+<h1>🎬 {title}</h1>
+{chart}
+{scenes}
+</body>
+</html>
+"""
+
+SCENE_TEMPLATE = """<div class="scene">
+<h2>🎥 Scene {number} <span class="mood">({mood})</span></h2>
+{image}
+<p><strong>Visual Description:</strong><br>{description}</p>
+<p><strong>Dialogue:</strong><br>{dialogue}</p>
+</div>"""
 
 def visualize_mood(mood_counts: dict, story_output_dir: str):
     """Create and display a mood visualization in the story-specific folder."""
     if not mood_counts:
-        display(Markdown("⚠️ No mood data available"))
+        display_markdown("⚠️ No mood data available")
         return
+    with tracing.span("mood_chart_render") as span:
+        if notebook_backend() and cpu_pool.enabled():
+            # Each worker has its own pyplot state, so no lock is needed there
+            chart_filename = cpu_pool.run(_render_mood_chart_agg, mood_counts, story_output_dir)
+        elif notebook_backend():
+            with _pyplot_lock:
+                chart_filename = _render_mood_chart(mood_counts, story_output_dir)
+        else:
+            chart_filename = cpu_pool.run(_draw_mood_chart, mood_counts, story_output_dir)
+        span.set(bytes=os.path.getsize(chart_filename))
+    tracing.inc("bytes_written_total", os.path.getsize(chart_filename), kind="mood_chart")
+    if notebook_backend():
+        display_markdown(f"![Mood Distribution Chart]({chart_filename})")
+    else:
+        print(f"📊 Mood chart saved to {chart_filename}")
+
+def _render_mood_chart(mood_counts: dict, story_output_dir: str) -> str:
+    """Draw the mood bar chart with matplotlib and save it; returns the chart path."""
+    import matplotlib.pyplot as plt
     moods = list(mood_counts.keys())
     counts = list(mood_counts.values())
     plt.figure(figsize=(10, 6))
     ax = plt.gca()
-    color_map = {
-        "joyful": "#FFD700", "romantic": "#FF69B4", "tense": "#8B0000",
-        "suspenseful": "#4B0082", "dark": "#000000", "hopeful": "#32CD32",
-        "chaotic": "#FF4500"
-    }
-    colors = [color_map.get(mood, "#888888") for mood in moods]
+    colors = [MOOD_COLORS.get(mood, "#888888") for mood in moods]
     bars = ax.bar(moods, counts, color=colors, edgecolor='white', linewidth=1)
     ax.set_title("Scene Mood Distribution", fontsize=16, pad=20, fontweight='bold')
     ax.set_xlabel("Mood Type", fontsize=12)
@@ -30,30 +84,91 @@ def visualize_mood(mood_counts: dict, story_output_dir: str):
                 fontsize=11, fontweight='bold')
     plt.xticks(rotation=45, ha='right', fontsize=11)
     plt.tight_layout()
-    
+
     # Ensure story-specific output directory exists
     os.makedirs(story_output_dir, exist_ok=True)
-    
+
     # Save chart in story-specific folder
     chart_filename = os.path.join(story_output_dir, "mood_distribution.png")
     plt.savefig(chart_filename, bbox_inches='tight')
     plt.close()
-    display(Markdown(f"![Mood Distribution Chart]({chart_filename})"))
+    return chart_filename
+
+def _render_mood_chart_agg(mood_counts: dict, story_output_dir: str) -> str:
+    """_render_mood_chart for CPU pool workers, which only write the file and never display."""
+    import matplotlib
+    matplotlib.use("Agg")
+    return _render_mood_chart(mood_counts, story_output_dir)
+
+@functools.lru_cache(maxsize=None)
+def _font(size: int):
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1 has a single fixed-size bitmap font
+        return ImageFont.load_default()
+
+def _draw_mood_chart(mood_counts: dict, story_output_dir: str, width: int = 1000, height: int = 600) -> str:
+    """Draw the mood bar chart directly with PIL (no matplotlib); returns the chart path."""
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    left, right, top, bottom = 80, width - 40, 80, height - 80
+    draw.text((width // 2, 35), "Scene Mood Distribution", fill="black", font=_font(26), anchor="mm")
+    peak = max(mood_counts.values())
+    # Dashed horizontal grid line per whole scene count
+    for count in range(peak + 1):
+        y = bottom - (bottom - top) * count / peak
+        for x in range(left, right, 12):
+            draw.line([(x, y), (x + 6, y)], fill="#DDDDDD")
+        draw.text((left - 12, y), str(count), fill="#444444", font=_font(14), anchor="rm")
+    draw.line([(left, top), (left, bottom), (right, bottom)], fill="#444444")
+    slot = (right - left) / len(mood_counts)
+    for i, (mood, count) in enumerate(mood_counts.items()):
+        x0, x1 = left + slot * (i + 0.15), left + slot * (i + 0.85)
+        y0 = bottom - (bottom - top) * count / peak
+        draw.rectangle([x0, y0, x1, bottom], fill=MOOD_COLORS.get(mood, "#888888"), outline="white")
+        draw.text(((x0 + x1) / 2, y0 - 6), str(count), fill="black", font=_font(16), anchor="mb")
+        draw.text(((x0 + x1) / 2, bottom + 10), mood, fill="black", font=_font(15), anchor="mt")
+    draw.text(((left + right) // 2, height - 25), "Mood Type", fill="black", font=_font(16), anchor="mm")
+    os.makedirs(story_output_dir, exist_ok=True)
+    chart_filename = os.path.join(story_output_dir, "mood_distribution.png")
+    image.save(chart_filename)
+    return chart_filename
 
 def display_storyboard(storyboard: dict, output_dir: str):
     """Render the storyboard in Markdown format with images."""
-    display(Markdown(f"## 🎬 {storyboard.get('title', 'Untitled Storyboard')}"))
-    for scene in storyboard.get("scenes", []):
-        mood = scene.get("mood", "neutral").lower()
-        image_filename = scene.get("image_filename")
-        if image_filename and os.path.exists(os.path.join(output_dir, image_filename)):
-            # Display image using IPython.display.Image
-            image_path = os.path.join(output_dir, image_filename)
-            display(Markdown(f"**Image for Scene {scene.get('scene_number', 1)}:**"))
-            display(Image(filename=image_path))
-        else:
-            display(Markdown("⚠️ No image available"))
-        display(Markdown(f"""
+    with tracing.span("storyboard_display"):
+        display_markdown(f"## 🎬 {storyboard.get('title', 'Untitled Storyboard')}")
+        for scene in storyboard.get("scenes", []):
+            display_scene(scene, output_dir)
+
+def display_storyboard_stream(scene_stream, output_dir: str) -> dict:
+    """Render scenes from StoryboardAgent.stream_storyboard as they arrive; returns the full storyboard."""
+    while True:
+        try:
+            scene = next(scene_stream)
+        except StopIteration as stop:
+            return stop.value
+        display_scene(scene, output_dir)
+
+def display_scene(scene: dict, output_dir: str):
+    """Render a single scene; inline Markdown and image in a notebook, a short summary otherwise."""
+    mood = scene.get("mood", "neutral").lower()
+    image_filename = scene.get("image_filename")
+    image_path = os.path.join(output_dir, image_filename) if image_filename else None
+    if not notebook_backend():
+        image_note = image_path if image_path and os.path.exists(image_path) else "no image available"
+        print(f"🎥 Scene {scene.get('scene_number', 1)} ({mood.capitalize()}): "
+              f"{scene.get('description', 'No description available')} [{image_note}]")
+        return
+    from IPython.display import display, Image
+    if image_path and os.path.exists(image_path):
+        display_markdown(f"**Image for Scene {scene.get('scene_number', 1)}:**")
+        display(Image(filename=image_path))
+    else:
+        display_markdown("⚠️ No image available")
+    display_markdown(f"""
 ### 🎥 Scene {scene.get('scene_number', 1)} ({mood.capitalize()})
 
 **Visual Description:**  
@@ -61,4 +176,40 @@ def display_storyboard(storyboard: dict, output_dir: str):
 
 **Dialogue:**  
 "{scene.get('dialogue', '...')}"
-"""))
\ No newline at end of file
+""")
+
+def _format_dialogue(dialogue) -> str:
+    if isinstance(dialogue, dict):
+        return "<br>".join(f"<em>{html.escape(str(speaker))}:</em> {html.escape(str(line))}"
+                           for speaker, line in dialogue.items())
+    return html.escape(str(dialogue))
+
+def write_storyboard_page(storyboard: dict, output_dir: str) -> str:
+    """Write a static HTML page with every scene, its image and the mood chart; returns the page path."""
+    with tracing.span("storyboard_page") as span:
+        scenes = []
+        for scene in storyboard.get("scenes", []):
+            # Prefer the compressed variant so the page stays light
+            variants = scene.get("image_variants") or {}
+            image_filename = next((variants[kind] for kind in ("webp", "jpeg") if kind in variants),
+                                  scene.get("image_filename"))
+            image = (f'<img src="{html.escape(image_filename)}" alt="Scene {scene.get("scene_number", 1)}">'
+                     if image_filename and os.path.exists(os.path.join(output_dir, image_filename))
+                     else "<p>⚠️ No image available</p>")
+            scenes.append(SCENE_TEMPLATE.format(
+                number=html.escape(str(scene.get("scene_number", 1))),
+                mood=html.escape(str(scene.get("mood", "neutral")).capitalize()),
+                image=image,
+                description=html.escape(str(scene.get("description", "No description available"))),
+                dialogue=_format_dialogue(scene.get("dialogue", "..."))
+            ))
+        chart = ('<img src="mood_distribution.png" alt="Mood Distribution Chart">'
+                 if os.path.exists(os.path.join(output_dir, "mood_distribution.png")) else "")
+        page = PAGE_TEMPLATE.format(title=html.escape(storyboard.get("title", "Untitled Storyboard")),
+                                    chart=chart, scenes="\n".join(scenes))
+        os.makedirs(output_dir or ".", exist_ok=True)
+        page_filename = os.path.join(output_dir, CONFIG["storyboard_page"])
+        with open(page_filename, "w", encoding="utf-8") as f:
+            f.write(page)
+        span.set(bytes=len(page.encode("utf-8")))
+    return page_filename